@@ -11,7 +11,10 @@ class ModuleDocFragment(object):
     DOCUMENTATION = r"""
     options:
         _terms:
-            description: Path to query.
+            description:
+                - Path to query.
+                - Several paths can be given, their MoIDs are returned in the same order. The
+                  paths with the same parent are resolved together.
             required: True
             type: string
         vcenter_hostname:
@@ -21,6 +24,71 @@ class ModuleDocFragment(object):
                 - name: VMWARE_HOST
             required: True
             type: string
+        vcenter_connection_limit:
+            description:
+                - The maximum number of simultaneous connections to the vCenter.
+                - Defaults to 20. Use V(0) for no limit.
+            env:
+                - name: VMWARE_CONNECTION_LIMIT
+            type: int
+            version_added: 4.0.0
+        vcenter_connection_limit_per_host:
+            description:
+                - The maximum number of simultaneous connections to the same endpoint.
+                - Defaults to V(0), no limit.
+            env:
+                - name: VMWARE_CONNECTION_LIMIT_PER_HOST
+            type: int
+            version_added: 4.0.0
+        vcenter_dns_cache_ttl:
+            description:
+                - How long, in seconds, the resolved address of the vCenter is cached.
+                - Defaults to 10 seconds.
+            env:
+                - name: VMWARE_DNS_CACHE_TTL
+            type: int
+            version_added: 4.0.0
+        vcenter_inventory_cache:
+            description:
+                - A directory where the inventory snapshots are kept between the runs, see
+                  O(vcenter_inventory_snapshot).
+                - The directory is created if needed. It must only be accessible by the user,
+                  the cache is not used otherwise.
+                - A saved snapshot older than E(VMWARE_INVENTORY_SNAPSHOT_TTL) is refreshed,
+                  only the containers that may hold a new object are listed again. A full
+                  snapshot is taken every E(VMWARE_INVENTORY_SNAPSHOT_MAX_AGE) seconds,
+                  86400 by default.
+            env:
+                - name: VMWARE_INVENTORY_CACHE
+            type: path
+            version_added: 4.0.0
+        vcenter_inventory_snapshot:
+            description:
+                - Resolve the path from a snapshot of the inventory of the datacenter.
+                - The folders, clusters, hosts, resource pools, datastores and networks of the
+                  datacenter are listed once, in parallel, and the snapshot is shared by all the
+                  lookups for E(VMWARE_INVENTORY_SNAPSHOT_TTL) seconds, 300 by default.
+                - This saves the requests of each path level when many objects of the same
+                  datacenter are looked up. The changes made in the inventory during that time
+                  are not seen.
+                - Once expired, the snapshot is refreshed, only the containers that may hold
+                  a new object are listed again.
+                - The datacenters and their folders have their own snapshot, used to resolve
+                  the datacenter of the paths.
+                - The snapshots are kept per vCenter and user.
+            default: false
+            env:
+                - name: VMWARE_INVENTORY_SNAPSHOT
+            type: boolean
+            version_added: 4.0.0
+        vcenter_keepalive_timeout:
+            description:
+                - How long, in seconds, an idle connection is kept open for reuse.
+                - Defaults to 15 seconds.
+            env:
+                - name: VMWARE_KEEPALIVE_TIMEOUT
+            type: float
+            version_added: 4.0.0
         vcenter_password:
             description:
                 - The vSphere vCenter password.
@@ -33,6 +101,8 @@ class ModuleDocFragment(object):
                 - You can use this optional parameter to set the location of a log file.
                 - This file will be used to record the HTTP REST interactions.
                 - The file will be stored on the host that runs the module.
+                - Set the E(VMWARE_REST_LOG_FORMAT) environment variable to V(jsonl) to write a JSON
+                  record per line, with the timestamps and the sizes of the requests.
             env:
                 - name: VMWARE_REST_LOG_FILE
             type: string
@@ -51,4 +121,10 @@ class ModuleDocFragment(object):
             env:
                 - name: VMWARE_VALIDATE_CERTS
             type: boolean
+    notes:
+        - The MoIDs found by the lookups can be kept in a cache shared by all the lookups
+          of the process by setting E(VMWARE_LOOKUP_CACHE_TTL) to a number of seconds,
+          the cache is disabled by default. The following lookups of paths with the same
+          prefix skip the requests of the known levels. An object that is deleted and
+          created again before the entry expires is resolved to its old MoID.
 """
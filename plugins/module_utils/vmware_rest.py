@@ -28,24 +28,1011 @@
 # USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
+import codecs
 import hashlib
 import importlib
 import json
+import os
 import re
+import time
 import urllib.parse
+from contextvars import ContextVar
 
 from ansible.module_utils.basic import missing_required_lib
 from ansible.module_utils.parsing.convert_bool import boolean
 
 
+class _RequestContextManager:
+    """Allow ``async with session.get(url) as resp:`` on a VmwareRestSession."""
+
+    def __init__(self, coro):
+        self._coro = coro
+        self._resp = None
+
+    async def __aenter__(self):
+        self._resp = await self._coro
+        return self._resp
+
+    async def __aexit__(self, exc_type, exc, tb):
+        flush_records(self._resp)
+        self._resp.release()
+
+
+class CachedResponse:
+    """A GET answer served from the response cache of a VmwareRestSession."""
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self._body = body
+
+    @property
+    def content_length(self):
+        return len(self._body)
+
+    async def read(self):
+        return self._body
+
+    async def text(self, encoding="utf-8"):
+        return self._body.decode(encoding)
+
+    async def json(self, **kwargs):
+        return json.loads(self._body)
+
+    def release(self):
+        pass
+
+
+class VmwareRestSession:
+    """A pooled, authenticated connection to a vCenter.
+
+    The object exposes the subset of the ``aiohttp.ClientSession`` API used
+    by the modules and the lookup plugins (get/post/patch/put/delete). The
+    ``vmware-api-session-id`` header is injected on each request so that,
+    when vCenter drops the session (HTTP 401), we can log in again once and
+    replay the request transparently. The transient failures are retried
+    according to the ``retry_policy`` and the load is regulated by the
+    ``limiter`` shared by all the sessions of the vCenter.
+    """
+
+    def __init__(self, session, login, retry_policy=None, limiter=None, connector=None):
+        self._session = session
+        self._connector = connector
+        self._login = login
+        self.retry_policy = retry_policy
+        self.limiter = limiter
+        self._login_lock = None
+        self.session_id = None
+        self.created_at = None
+        self.last_used = None
+        # The DELETE end-point that closes the vCenter session, see logout()
+        self.logout_url = None
+        # The tasks (module runs, lookups) that hold the session, see lease()
+        self.users = 0
+        # Overrides VMWARE_MAX_CONCURRENT_REQUESTS for the fan-outs
+        self.max_concurrency = None
+        # The /api/vcenter/vm/{vm} documents, see get_vm_document()
+        self.vm_documents = None
+        # The GET answers, see VMWARE_REST_RESPONSE_CACHE_TTL
+        self.responses = None
+        # The vCenter tasks in progress, see TaskPoller
+        self.task_poller = None
+
+    @property
+    def closed(self):
+        return self._session.closed
+
+    def idle_time(self):
+        if self.last_used is None:
+            return 0
+        return time.monotonic() - self.last_used
+
+    def age(self):
+        if self.created_at is None:
+            return 0
+        return time.monotonic() - self.created_at
+
+    async def authenticate(self, stale_session_id=None):
+        """Open a new vCenter session.
+
+        If ``stale_session_id`` is set, a new login is only done if no other
+        coroutine has already replaced that session ID in the meantime.
+        """
+        import asyncio
+
+        if self._login_lock is None:
+            self._login_lock = asyncio.Lock()
+        async with self._login_lock:
+            if stale_session_id and self.session_id != stale_session_id:
+                return
+            self.session_id = await self._login()
+            self.created_at = self.last_used = time.monotonic()
+
+    def adopt(self, session_id):
+        """Use a vCenter session opened by another process."""
+        self.session_id = session_id
+        self.created_at = self.last_used = time.monotonic()
+
+    def lease(self):
+        """Count the current task as a user of the session, until it ends.
+
+        The SessionPool does not close a session that is still in use, even
+        between two requests.
+        """
+        import asyncio
+
+        task = asyncio.current_task()
+        if task is None:
+            return
+        self.users += 1
+        task.add_done_callback(self._release)
+
+    def _release(self, task):
+        self.users -= 1
+
+    def in_use(self):
+        return self.users > 0 or self.busy()
+
+    async def logout(self):
+        """Close the vCenter session, its ID cannot be used anymore."""
+        if not (self.logout_url and self.session_id) or self.closed:
+            return
+        try:
+            async with self._session.delete(
+                self.logout_url, headers={"vmware-api-session-id": self.session_id}
+            ) as resp:
+                await resp.read()
+        except Exception:
+            # vCenter drops the session anyway once it has expired
+            pass
+        self.session_id = None
+
+    def request(self, method, url, **kwargs):
+        return _RequestContextManager(self._request(method, url, **kwargs))
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    async def _send(self, method, url, kwargs):
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers["vmware-api-session-id"] = self.session_id
+        if not self.limiter:
+            return await self._session.request(method, url, headers=headers, **kwargs)
+        await self.limiter.acquire()
+        start = time.monotonic()
+        status = None
+        try:
+            resp = await self._session.request(method, url, headers=headers, **kwargs)
+            status = resp.status
+            return resp
+        finally:
+            await self.limiter.release(
+                status,
+                time.monotonic() - start,
+                endpoint=f"{method} {endpoint_template(url)}",
+            )
+
+    def invalidate(self, url):
+        """Forget the cached documents that a write on ``url`` may change."""
+        for documents in (self.vm_documents, _run_vm_documents.get()):
+            if documents:
+                documents.invalidate(url)
+        if self.responses:
+            self.responses.invalidate(url)
+
+    async def _request(self, method, url, cache=True, **kwargs):
+        import asyncio
+
+        if method != "GET":
+            self.invalidate(url)
+        elif self.responses and cache:
+            cached = self.responses.get(str(url))
+            if cached is not None:
+                self.last_used = time.monotonic()
+                return CachedResponse(*cached)
+
+        policy = self.retry_policy
+        attempt = 0
+        reauthenticated = False
+        while True:
+            session_id = self.session_id
+            try:
+                resp = await self._send(method, url, dict(kwargs))
+            except Exception as e:
+                if not (policy and policy.should_retry(method, attempt, exception=e)):
+                    raise
+                await asyncio.sleep(policy.delay(attempt))
+                attempt += 1
+                continue
+            if resp.status == 401 and not reauthenticated:
+                # The vCenter session has expired or has been revoked
+                await resp.read()
+                resp.release()
+                await self.authenticate(stale_session_id=session_id)
+                reauthenticated = True
+                continue
+            if policy and policy.should_retry(method, attempt, status=resp.status):
+                delay = policy.delay(attempt, resp)
+                await resp.read()
+                resp.release()
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            break
+        if method == "GET" and self.responses and cache and resp.status == 200:
+            body = await resp.read()
+            self.responses.set(str(url), (resp.status, resp.headers.copy(), body))
+        self.last_used = time.monotonic()
+        return resp
+
+    def busy(self):
+        """Tell if some requests are still using the connections."""
+        connector = self._connector
+        return bool(connector and getattr(connector, "_acquired", None))
+
+    def socket_count(self):
+        """Number of connections opened by the connector, busy or idle."""
+        connector = self._connector
+        if connector is None or connector.closed:
+            return 0
+        acquired = len(getattr(connector, "_acquired", ()))
+        idle = sum(len(i) for i in getattr(connector, "_conns", {}).values())
+        return acquired + idle
+
+    async def close(self):
+        import inspect
+
+        await self._session.close()
+        if self._connector is not None and not self._connector.closed:
+            # The connector is shared with the login session
+            # (connector_owner=False), it has to be closed explicitly.
+            closing = self._connector.close()
+            if inspect.isawaitable(closing):
+                await closing
+
+
+class AdaptiveLimiter:
+    """Cap the number of requests in flight on a vCenter.
+
+    The limit follows an AIMD (additive-increase, multiplicative-decrease)
+    scheme: it grows by one every time a full window of requests succeeds
+    and is halved when vCenter is overloaded, that is when it answers with
+    a 429/503 or when the connection fails. With ``latency_signal``, a
+    latency over twice the long term average of the same endpoint is an
+    overload too. One limiter is shared by all the sessions that target
+    the same vCenter.
+    """
+
+    _limiters = {}
+
+    def __init__(self, max_limit=32, min_limit=1, cooldown=1.0, latency_signal=False):
+        self.max_limit = max(max_limit, min_limit)
+        self.min_limit = min_limit
+        self.limit = float(self.max_limit)
+        self.cooldown = cooldown
+        self.latency_signal = latency_signal
+        self.in_flight = 0
+        self._condition = None
+        self._last_decrease = 0.0
+        # endpoint: [fast average, slow average] of the latency
+        self._latencies = {}
+
+    @classmethod
+    def get(cls, vcenter_hostname):
+        """Return the limiter of a vCenter, or None if the feature is disabled."""
+        if not _setting(None, "VMWARE_REST_ADAPTIVE_LIMIT", True, boolean):
+            return None
+        if vcenter_hostname not in cls._limiters:
+            cls._limiters[vcenter_hostname] = cls(
+                max_limit=_setting(None, "VMWARE_REST_MAX_IN_FLIGHT", 32, int),
+                latency_signal=_setting(
+                    None, "VMWARE_REST_ADAPTIVE_LATENCY", False, boolean
+                ),
+            )
+        return cls._limiters[vcenter_hostname]
+
+    def _get_condition(self):
+        import asyncio
+
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self):
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    def _overloaded(self, status, latency, endpoint):
+        if status is None or status in (429, 503):
+            return True
+        if not self.latency_signal:
+            return False
+        # A list or a clone is always slower than a GET, each endpoint is
+        # compared with its own history
+        averages = self._latencies.get(endpoint)
+        if averages is None:
+            self._latencies[endpoint] = [latency, latency]
+            return False
+        averages[0] += 0.3 * (latency - averages[0])
+        averages[1] += 0.02 * (latency - averages[1])
+        return averages[0] > 2 * averages[1]
+
+    async def release(self, status, latency, endpoint=None):
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if self._overloaded(status, latency, endpoint):
+                # Only react once per burst of failures
+                if now - self._last_decrease > self.cooldown:
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            condition.notify_all()
+
+
+class SessionTokenCache:
+    """Share the vCenter session IDs between processes through files.
+
+    Without the turbo daemon, every module opens its own vCenter session.
+    With this cache, the forks reuse the same session ID. There is one file
+    per open_session() digest, only readable by the user, in a directory
+    that must not be accessible to the other users.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @classmethod
+    def from_env(cls):
+        directory = os.environ.get("VMWARE_REST_SESSION_CACHE")
+        if not directory:
+            return None
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        st = os.stat(directory)
+        if st.st_uid != os.getuid() or st.st_mode & 0o077:
+            # Someone else could read or replace our session IDs
+            return None
+        return cls(directory)
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest)
+
+    def read(self, digest):
+        try:
+            with open(self._path(digest), encoding="utf-8") as fd:
+                return json.load(fd)["session_id"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def write(self, digest, session_id):
+        import tempfile
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"session_id": session_id, "created": time.time()}, f)
+            os.replace(tmp_path, self._path(digest))
+        except OSError:
+            os.unlink(tmp_path)
+
+    def lock(self, digest):
+        return _FileLock(self._path(digest) + ".lock")
+
+
+class _FileLock:
+    """An exclusive flock() that does not block the event loop."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    async def __aenter__(self):
+        import asyncio
+        import fcntl
+
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None, fcntl.flock, self._fd, fcntl.LOCK_EX
+            )
+        except BaseException:
+            os.close(self._fd)
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        import fcntl
+
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+
+
+class RetryPolicy:
+    """When and how long to wait before a failed request is sent again.
+
+    By default, only the idempotent methods are retried, on a 429, 502,
+    503 or 504 answer or if the connection is reset. The wait grows
+    exponentially with a full jitter, unless vCenter sends a Retry-After.
+    """
+
+    statuses = frozenset((429, 502, 503, 504))
+
+    def __init__(
+        self, aiohttp, retries=None, backoff=None, max_backoff=None, methods=None
+    ):
+        self.retries = _setting(retries, "VMWARE_REST_RETRIES", 3, int)
+        self.backoff = _setting(backoff, "VMWARE_REST_RETRY_BACKOFF", 0.5, float)
+        self.max_backoff = _setting(
+            max_backoff, "VMWARE_REST_RETRY_MAX_BACKOFF", 30.0, float
+        )
+        methods = _setting(
+            methods, "VMWARE_REST_RETRY_METHODS", "DELETE,GET,HEAD,OPTIONS,PUT", str
+        )
+        if isinstance(methods, str):
+            methods = methods.split(",")
+        self.methods = frozenset(m.strip().upper() for m in methods)
+        self.exceptions = (aiohttp.ServerDisconnectedError, aiohttp.ClientOSError)
+        # A certificate problem won't go away by itself
+        self.fatal_exceptions = (aiohttp.ClientSSLError,)
+
+    def should_retry(self, method, attempt, status=None, exception=None):
+        if attempt >= self.retries or method.upper() not in self.methods:
+            return False
+        if exception is not None:
+            return isinstance(exception, self.exceptions) and not isinstance(
+                exception, self.fatal_exceptions
+            )
+        return status in self.statuses
+
+    def delay(self, attempt, resp=None):
+        import random
+
+        retry_after = resp.headers.get("Retry-After") if resp is not None else None
+        if retry_after:
+            try:
+                return min(max(float(retry_after), 0), self.max_backoff)
+            except ValueError:
+                from email.utils import parsedate_to_datetime
+
+                try:
+                    wait = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                    return min(max(wait, 0), self.max_backoff)
+                except (TypeError, ValueError):
+                    pass
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+
+class SessionPool:
+    """The registry of the opened VmwareRestSession, by open_session() digest.
+
+    The pool is bounded: the least recently used sessions are closed, with
+    their connector, when there are more than ``max_size`` of them, and so
+    are the sessions that have not been used for ``max_idle`` seconds.
+    They are logged out first, so they do not count against the session
+    limit of vCenter until they expire. A session leased by a running task
+    or with requests in progress is never closed.
+    """
+
+    def __init__(self, max_size=None, max_idle=None):
+        import collections
+
+        self.max_size = _setting(max_size, "VMWARE_REST_POOL_SIZE", 16, int)
+        self.max_idle = _setting(max_idle, "VMWARE_REST_POOL_MAX_IDLE", 3600.0, float)
+        self._sessions = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, digest):
+        return digest in self._sessions
+
+    def get(self, digest):
+        session = self._sessions.get(digest)
+        if session is None:
+            return None
+        if session.closed:
+            del self._sessions[digest]
+            return None
+        self._sessions.move_to_end(digest)
+        return session
+
+    async def add(self, digest, session):
+        self._sessions[digest] = session
+        self._sessions.move_to_end(digest)
+        await self.evict()
+
+    async def evict(self):
+        """Close the idle sessions and the ones over the size limit."""
+        expired = [
+            k
+            for k, v in self._sessions.items()
+            if v.closed or (v.idle_time() > self.max_idle and not v.in_use())
+        ]
+        # From the least recently used
+        for k, v in self._sessions.items():
+            if len(self._sessions) - len(expired) <= self.max_size:
+                break
+            if k not in expired and not v.in_use():
+                expired.append(k)
+        for k in expired:
+            await self._discard(self._sessions.pop(k))
+
+    async def close_all(self):
+        while self._sessions:
+            _, session = self._sessions.popitem()
+            await self._discard(session)
+
+    @staticmethod
+    async def _discard(session):
+        await session.logout()
+        await session.close()
+
+    def stats(self):
+        return {
+            "sessions": len(self._sessions),
+            "sockets": sum(i.socket_count() for i in self._sessions.values()),
+        }
+
+
+async def _login(aiohttp, connector, trace_configs, vcenter_hostname, auth):
+    exceptions = importlib.import_module(
+        "ansible_collections.cloud.common.plugins.module_utils.turbo.exceptions"
+    )
+    async with aiohttp.ClientSession(
+        connector=connector, connector_owner=False, trace_configs=trace_configs
+    ) as session:
+        try:
+            async with session.post(
+                "https://{hostname}/rest/com/vmware/cis/session".format(
+                    hostname=vcenter_hostname
+                ),
+                auth=auth,
+            ) as resp:
+                if resp.status != 200:
+                    raise exceptions.EmbeddedModuleFailure(
+                        "Authentication failure. code: {0}, json: {1}".format(
+                            resp.status, await resp.text()
+                        )
+                    )
+                json = await resp.json()
+        except aiohttp.client_exceptions.ClientConnectorError as e:
+            raise exceptions.EmbeddedModuleFailure(f"Authentication failure: {e}")
+    return json["value"]
+
+
+# The PerfCollector of the module being run. A ContextVar because several
+# modules run in parallel in the turbo daemon.
+_perf_collector = ContextVar("vmware_rest_perf_collector", default=None)
+
+
+class RequestLogger:
+    """Write the HTTP interactions in a file from a background thread.
+
+    The records are queued by the event loop and written by batches, so a
+    large fan-out is never serialized on the disk I/O. With the ``text``
+    format, the records are written as before, one block per request. With
+    ``jsonl``, each record is a JSON line.
+    """
+
+    _loggers = {}
+
+    def __init__(
+        self, path, max_body=None, flush_interval=1.0, batch_size=200, fmt="jsonl"
+    ):
+        import queue
+        import threading
+
+        self.path = path
+        self.max_body = max_body
+        self.format = _text_record if fmt == "text" else _jsonl_record
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="vmware_rest_request_logger", daemon=True
+        )
+        self._thread.start()
+
+    @classmethod
+    def get(cls, path, fmt="jsonl"):
+        """Return the logger of a file, all the sessions share the same one."""
+        if path not in cls._loggers:
+            max_body = os.environ.get("VMWARE_REST_LOG_MAX_BODY")
+            cls._loggers[path] = cls(
+                path, max_body=int(max_body) if max_body else None, fmt=fmt
+            )
+            if len(cls._loggers) == 1:
+                import atexit
+
+                atexit.register(cls.close_all)
+        return cls._loggers[path]
+
+    @classmethod
+    def close_all(cls):
+        for logger in cls._loggers.values():
+            logger.close()
+        cls._loggers = {}
+
+    def log(self, record):
+        self._queue.put(record)
+
+    def body(self, chunk):
+        if self.max_body is not None and len(chunk) > self.max_body:
+            text = chunk[: self.max_body].decode("utf-8", errors="replace")
+            return text + f"... ({len(chunk) - self.max_body} bytes truncated)"
+        return chunk.decode("utf-8", errors="replace")
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        import queue
+
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                pass
+            if None in batch:
+                running = False
+                batch = batch[: batch.index(None)]
+            if not batch:
+                continue
+            with open(self.path, "a", encoding="utf-8") as fd:
+                fd.writelines(self.format(r) for r in batch)
+
+
+def _jsonl_record(record):
+    return json.dumps(record) + "\n"
+
+
+def _text_record(record):
+    # The format of the log before the JSONL records
+    text = f"{record['method']}: {record['url']}\n" f"headers: {record['headers']}\n"
+    if "error" in record:
+        return text + f"  error: {record['error']}\n\n"
+    return text + (
+        f"  status: {record['status']}\n" f"  answer: {record.get('answer', '')}\n\n"
+    )
+
+
+def _loggable_headers(headers):
+    hidden = ("authorization", "vmware-api-session-id")
+    return {k: "********" if k.lower() in hidden else v for k, v in headers.items()}
+
+
+# The answer of a login is the session ID
+_LOGIN_PATHS = ("/api/session", "/rest/com/vmware/cis/session")
+
+
+def _loggable_answer(record, body):
+    if (
+        record["method"] == "POST"
+        and urllib.parse.urlsplit(record["url"]).path in _LOGIN_PATHS
+    ):
+        return "********"
+    return body
+
+
+def _has_body(response):
+    """Tell if the caller is expected to read the body of a response."""
+    return response.status not in (204, 304) and response.content_length != 0
+
+
+def defer_record(response, emit):
+    """Postpone a trace record until the body of ``response`` is consumed.
+
+    ``emit(body, size)`` is called by flush_records(): when the body has
+    been streamed (``body`` is None) or when the response is released
+    without its body being read (``size`` is 0).
+    """
+    pending = getattr(response, "_pending_records", None)
+    if pending is None:
+        pending = response._pending_records = []
+    pending.append(emit)
+
+
+def flush_records(response, body=None, size=0):
+    """Emit the trace records that are still waiting for ``response``."""
+    pending = getattr(response, "_pending_records", None)
+    while pending:
+        pending.pop(0)(body, size)
+
+
+def request_log_trace_config(aiohttp, logger):
+    """Build the TraceConfig that feeds a RequestLogger.
+
+    A record is emitted once the body has been read by the caller, the
+    body is not read a second time for the log. The responses that are
+    streamed or released unread are logged by flush_records().
+    """
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_request_start(session, ctx, params):
+        ctx.record = {
+            "method": params.method,
+            "url": str(params.url),
+            "headers": _loggable_headers(params.headers),
+            "start": time.time(),
+            "request_bytes": 0,
+        }
+
+    async def on_request_chunk_sent(session, ctx, params):
+        ctx.record["request_bytes"] += len(params.chunk)
+
+    def emit(ctx, body, size):
+        if ctx.emitted:
+            return
+        ctx.emitted = True
+        ctx.record["end"] = time.time()
+        ctx.record["response_bytes"] = size
+        if body is not None:
+            ctx.record["answer"] = _loggable_answer(ctx.record, logger.body(body))
+        logger.log(ctx.record)
+
+    async def on_request_end(session, ctx, params):
+        response = params.response
+        ctx.record["status"] = response.status
+        ctx.record["end"] = time.time()
+        ctx.record["response_bytes"] = 0
+        ctx.emitted = False
+        if _has_body(response):
+            defer_record(response, lambda body, size: emit(ctx, body, size))
+        else:
+            emit(ctx, None, 0)
+
+    async def on_response_chunk_received(session, ctx, params):
+        emit(ctx, params.chunk, len(params.chunk))
+
+    async def on_request_exception(session, ctx, params):
+        ctx.record["end"] = time.time()
+        ctx.record["error"] = repr(params.exception)
+        logger.log(ctx.record)
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_chunk_sent.append(on_request_chunk_sent)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_response_chunk_received.append(on_response_chunk_received)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+
+def endpoint_template(url):
+    """Turn an URL into its endpoint template.
+
+    The path segments that look like an object ID are replaced by the name
+    of the collection they belong to, e.g:
+    /api/vcenter/vm/vm-1001/hardware/disk/2000 -> /api/vcenter/vm/{vm}/hardware/disk/{disk}
+    """
+    path = urllib.parse.urlsplit(str(url)).path
+    segments = path.split("/")
+    for i, segment in enumerate(segments):
+        if i > 1 and re.search("[0-9]", segment):
+            segments[i] = "{%s}" % segments[i - 1]
+    return "/".join(segments)
+
+
+class PerfCollector:
+    """Aggregate the latency of the REST calls of a module run by endpoint."""
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.endpoints = {}
+
+    def add(self, record):
+        key = f"{record['method']} {record['endpoint']}"
+        stats = self.endpoints.setdefault(
+            key,
+            {
+                "count": 0,
+                "errors": 0,
+                "total": 0.0,
+                "max": 0.0,
+                "dns": 0.0,
+                "connect": 0.0,
+                "ttfb": 0.0,
+                "bytes": 0,
+            },
+        )
+        stats["count"] += 1
+        if record.get("error") or record.get("status", 0) >= 400:
+            stats["errors"] += 1
+        stats["max"] = max(stats["max"], record["total"])
+        for k in ("total", "dns", "connect", "ttfb", "bytes"):
+            stats[k] += record.get(k) or 0
+
+    def summary(self):
+        return {
+            "requests": sum(i["count"] for i in self.endpoints.values()),
+            "elapsed": round(time.monotonic() - self.start, 6),
+            "endpoints": {
+                k: {i: round(j, 6) for i, j in v.items()}
+                for k, v in sorted(self.endpoints.items(), key=lambda x: -x[1]["total"])
+            },
+        }
+
+
+def perf_collector():
+    """Return the PerfCollector of the running module, if any."""
+    return _perf_collector.get()
+
+
+def with_perf(data):
+    """Add the perf summary of the running module to its result, if collected."""
+    collector = perf_collector()
+    if collector:
+        data["_perf"] = collector.summary()
+    return data
+
+
+def perf_trace_config(aiohttp, perf_file=None):
+    """Build the TraceConfig that measures the REST calls.
+
+    For each request we record the DNS resolution, the connection (TCP and
+    TLS handshake), the time to first byte and the total latency. The
+    records go to the PerfCollector of the current module run and, if set,
+    to the ``perf_file`` JSONL file.
+    """
+    writer = RequestLogger.get(perf_file) if perf_file else None
+    trace_config = aiohttp.TraceConfig()
+
+    def emit(ctx, **kwargs):
+        now = time.monotonic()
+        record = {
+            "method": ctx.method,
+            "endpoint": endpoint_template(ctx.url),
+            "start": ctx.start_time,
+            "dns": ctx.dns,
+            "connect": ctx.connect,
+            "ttfb": ctx.ttfb,
+            "total": now - ctx.start,
+            **kwargs,
+        }
+        if ctx.collector:
+            ctx.collector.add(record)
+        if writer:
+            writer.log(record)
+
+    async def on_request_start(session, ctx, params):
+        ctx.collector = perf_collector()
+        ctx.method = params.method
+        ctx.url = params.url
+        ctx.start_time = time.time()
+        ctx.start = time.monotonic()
+        ctx.dns = ctx.connect = ctx.ttfb = None
+
+    async def on_dns_resolvehost_start(session, ctx, params):
+        ctx.dns_start = time.monotonic()
+
+    async def on_dns_resolvehost_end(session, ctx, params):
+        ctx.dns = time.monotonic() - ctx.dns_start
+
+    async def on_connection_create_start(session, ctx, params):
+        ctx.connect_start = time.monotonic()
+
+    async def on_connection_create_end(session, ctx, params):
+        ctx.connect = time.monotonic() - ctx.connect_start
+
+    def emit_response(ctx, size):
+        if not ctx.emitted:
+            ctx.emitted = True
+            emit(ctx, status=ctx.status, bytes=size)
+
+    async def on_request_end(session, ctx, params):
+        ctx.ttfb = time.monotonic() - ctx.start
+        ctx.status = params.response.status
+        ctx.emitted = False
+        if _has_body(params.response):
+            defer_record(params.response, lambda body, size: emit_response(ctx, size))
+        else:
+            emit_response(ctx, 0)
+
+    async def on_response_chunk_received(session, ctx, params):
+        emit_response(ctx, len(params.chunk))
+
+    async def on_request_exception(session, ctx, params):
+        emit(ctx, error=repr(params.exception))
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+    trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_response_chunk_received.append(on_response_chunk_received)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+
+def _setting(value, env_var, default, cast):
+    if value is None:
+        value = os.environ.get(env_var)
+    if value is None or value == "":
+        return default
+    return cast(value)
+
+
+def connector_settings(
+    connection_limit=None,
+    connection_limit_per_host=None,
+    keepalive_timeout=None,
+    dns_cache_ttl=None,
+):
+    """Resolve the TCPConnector tuning, using the environment as a fallback."""
+    return {
+        "limit": _setting(connection_limit, "VMWARE_CONNECTION_LIMIT", 20, int),
+        "limit_per_host": _setting(
+            connection_limit_per_host, "VMWARE_CONNECTION_LIMIT_PER_HOST", 0, int
+        ),
+        "keepalive_timeout": _setting(
+            keepalive_timeout, "VMWARE_KEEPALIVE_TIMEOUT", 15.0, float
+        ),
+        "ttl_dns_cache": _setting(dns_cache_ttl, "VMWARE_DNS_CACHE_TTL", 10, int),
+    }
+
+
+def ssl_context(validate_certs):
+    """Return the SSL context shared by all the connectors.
+
+    Building a context loads the whole CA bundle, we only do it once per
+    validate_certs value.
+    """
+    if not validate_certs:
+        return False
+    if ssl_context._cache is None:
+        import ssl
+
+        ssl_context._cache = ssl.create_default_context()
+    return ssl_context._cache
+
+
+ssl_context._cache = None
+
+
 async def open_session(
     vcenter_hostname=None,
     vcenter_username=None,
     vcenter_password=None,
     validate_certs=True,
     log_file=None,
+    connection_limit=None,
+    connection_limit_per_host=None,
+    keepalive_timeout=None,
+    dns_cache_ttl=None,
 ):
     validate_certs = boolean(validate_certs)
+    collect_perf = _setting(None, "VMWARE_REST_PERF", False, boolean)
+    if collect_perf:
+        # The _perf key of the module result
+        _perf_collector.set(PerfCollector())
+    perf_file = os.environ.get("VMWARE_REST_PERF_FILE")
+    connector_options = connector_settings(
+        connection_limit=connection_limit,
+        connection_limit_per_host=connection_limit_per_host,
+        keepalive_timeout=keepalive_timeout,
+        dns_cache_ttl=dns_cache_ttl,
+    )
     m = hashlib.sha256()
     m.update(vcenter_hostname.encode())
     m.update(vcenter_username.encode())
@@ -53,10 +1040,20 @@ async def open_session(
     if log_file:
         m.update(log_file.encode())
     m.update(b"yes" if validate_certs else b"no")
+    m.update(json.dumps(connector_options, sort_keys=True).encode())
+    # The perf trace config is only installed when it is needed
+    m.update(json.dumps([collect_perf, perf_file]).encode())
     digest = m.hexdigest()
-    # TODO: Handle session timeout
-    if digest in open_session._pool:
-        return open_session._pool[digest]
+    await open_session._pool.evict()
+    session = open_session._pool.get(digest)
+    if session:
+        # vCenter drops the sessions that have been idle for too long (30
+        # minutes by default), renew it now rather than waiting for a 401.
+        max_idle = float(os.environ.get("VMWARE_SESSION_MAX_IDLE", 1500))
+        if session.idle_time() > max_idle:
+            await session.authenticate(stale_session_id=session.session_id)
+        session.lease()
+        return session
 
     exceptions = importlib.import_module(
         "ansible_collections.cloud.common.plugins.module_utils.turbo.exceptions"
@@ -69,64 +1066,75 @@ async def open_session(
     if not aiohttp:
         raise exceptions.EmbeddedModuleFailure(msg="Failed to import aiohttp")
 
+    trace_configs = []
+    if collect_perf or perf_file:
+        trace_configs.append(perf_trace_config(aiohttp, perf_file))
     if log_file:
-        trace_config = aiohttp.TraceConfig()
-
-        async def on_request_end(session, trace_config_ctx, params):
-            with open(log_file, "a+", encoding="utf-8") as fd:
-                answer = await params.response.text()
-                fd.write(
-                    f"{params.method}: {params.url}\n"
-                    f"headers: {params.headers}\n"
-                    f"  status: {params.response.status}\n"
-                    f"  answer: {answer}\n\n"
-                )
-
-        trace_config.on_request_end.append(on_request_end)
-        trace_configs = [trace_config]
-    else:
-        trace_configs = []
+        log_format = _setting(None, "VMWARE_REST_LOG_FORMAT", "text", str)
+        trace_configs.append(
+            request_log_trace_config(aiohttp, RequestLogger.get(log_file, log_format))
+        )
 
     auth = aiohttp.BasicAuth(vcenter_username, vcenter_password)
-    if validate_certs:
-        connector = aiohttp.TCPConnector(limit=20)
-    else:
-        connector = aiohttp.TCPConnector(limit=20, ssl=False)
-    async with aiohttp.ClientSession(
-        connector=connector, connector_owner=False, trace_configs=trace_configs
-    ) as session:
-        try:
-            async with session.post(
-                "https://{hostname}/rest/com/vmware/cis/session".format(
-                    hostname=vcenter_hostname
-                ),
-                auth=auth,
-            ) as resp:
-                if resp.status != 200:
-                    raise exceptions.EmbeddedModuleFailure(
-                        "Authentication failure. code: {0}, json: {1}".format(
-                            resp.status, await resp.text()
-                        )
-                    )
-                json = await resp.json()
-        except aiohttp.client_exceptions.ClientConnectorError as e:
-            raise exceptions.EmbeddedModuleFailure(f"Authentication failure: {e}")
+    connector = aiohttp.TCPConnector(
+        ssl=ssl_context(validate_certs), **connector_options
+    )
+
+    token_cache = SessionTokenCache.from_env()
+
+    async def login():
+        session_id = await _login(
+            aiohttp, connector, trace_configs, vcenter_hostname, auth
+        )
+        if token_cache:
+            token_cache.write(digest, session_id)
+        return session_id
 
-    session_id = json["value"]
-    session = aiohttp.ClientSession(
+    session = VmwareRestSession(
+        aiohttp.ClientSession(
+            connector=connector,
+            headers={
+                "content-type": "application/json",
+            },
+            connector_owner=False,
+            trace_configs=trace_configs,
+        ),
+        login,
+        retry_policy=RetryPolicy(aiohttp),
+        limiter=AdaptiveLimiter.get(vcenter_hostname),
         connector=connector,
-        headers={
-            "vmware-api-session-id": session_id,
-            "content-type": "application/json",
-        },
-        connector_owner=False,
-        trace_configs=trace_configs,
     )
-    open_session._pool[digest] = session
+    session.logout_url = f"https://{vcenter_hostname}/api/session"
+    response_cache_ttl = _setting(None, "VMWARE_REST_RESPONSE_CACHE_TTL", 0, float)
+    if response_cache_ttl > 0:
+        session.responses = _DocumentCache(
+            ttl=response_cache_ttl,
+            max_size=_setting(None, "VMWARE_REST_RESPONSE_CACHE_SIZE", 512, int),
+        )
+    session.max_concurrency = _setting(
+        None, "VMWARE_MAX_CONCURRENT_REQUESTS", connection_limit(session) or 20, int
+    )
+    try:
+        if token_cache:
+            # The lock prevents the forks of a run from all logging in at once
+            async with token_cache.lock(digest):
+                session_id = token_cache.read(digest)
+                if session_id:
+                    # Validated lazily, an expired one ends up with a 401
+                    session.adopt(session_id)
+                else:
+                    await session.authenticate()
+        else:
+            await session.authenticate()
+    except Exception:
+        await session.close()
+        raise
+    session.lease()
+    await open_session._pool.add(digest, session)
     return session
 
 
-open_session._pool = {}
+open_session._pool = SessionPool()
 
 
 def gen_args(params, in_query_parameter):
@@ -266,20 +1274,192 @@ async def update_changed_flag(data, status, operation):
     elif data.get("value", {}).get("error", {}).get("errors", []):
         data["failed"] = True
 
-    return data
+    return with_perf(data)
 
 
 async def list_devices(session, url):
-    pass
-
     async with session.get(url) as resp:
-        _json = await resp.json()
-        return _json
+        return await read_json(resp)
+
+
+class JsonListStream:
+    """Parse the JSON list of a response as the data arrives.
+
+    ``async for element in JsonListStream(resp)`` yields the elements of the
+    list as soon as they are complete, so the caller can process them while
+    the rest of the body is still on the wire and the raw body is never held
+    in memory. Any other document (an error, or the ``{"value": [...]}``
+    answers of vSphere < 7.0.2) is parsed at once: nothing is yielded and the
+    result is available in ``document``. ClientResponse.read() is not used,
+    so the trace records of the response (REST log, perf stats) are emitted
+    with flush_records() once the body is consumed.
+    """
+
+    def __init__(self, resp, chunk_size=65536):
+        self.resp = resp
+        self.chunk_size = chunk_size
+        self.is_list = None
+        self.document = None
+        self.size = 0
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        content = getattr(self.resp, "content", None)
+        if content is None or content.at_eof():
+            # The body has already been read, e.g: by the response cache
+            document = await self.resp.json()
+            self.is_list = isinstance(document, list)
+            if not self.is_list:
+                self.document = document
+                return
+            for element in document:
+                yield element
+            return
+
+        try:
+            async for element in self._parse(content):
+                yield element
+        finally:
+            flush_records(self.resp, size=self.size)
+
+    async def _read(self, content, size=-1):
+        data = await content.read(size)
+        self.size += len(data)
+        return data
+
+    async def _parse(self, content):
+        decoder = json.JSONDecoder()
+        utf8 = codecs.getincrementaldecoder("utf-8")()
+        buffer = ""
+        position = 0
+        eof = False
+        while True:
+            while True:
+                while position < len(buffer) and buffer[position] in " \t\r\n":
+                    position += 1
+                if position == len(buffer):
+                    break
+                char = buffer[position]
+                if self.is_list is None:
+                    self.is_list = char == "["
+                    if not self.is_list:
+                        break
+                    position += 1
+                    continue
+                if char == "]":
+                    # Consume the trailer so the connection can be reused
+                    await self._read(content)
+                    return
+                if char == ",":
+                    position += 1
+                    continue
+                try:
+                    element, end = decoder.raw_decode(buffer, position)
+                except ValueError:
+                    # The element is not complete yet
+                    break
+                if (
+                    isinstance(element, (int, float))
+                    and not eof
+                    and (end == len(buffer) or buffer[end] not in " \t\r\n,]")
+                ):
+                    # The number may go on in the next chunk, e.g: "-4.5" of "-4.5e10"
+                    break
+                position = end
+                yield element
 
+            if self.is_list is False:
+                buffer = buffer[position:] + utf8.decode(
+                    await self._read(content), True
+                )
+                self.document = json.loads(buffer)
+                return
+            if eof:
+                if self.is_list is None:
+                    # Empty body
+                    self.is_list = False
+                    return
+                exceptions = importlib.import_module(
+                    "ansible_collections.cloud.common.plugins.module_utils.turbo.exceptions"
+                )
+                raise exceptions.EmbeddedModuleFailure(
+                    f"Truncated or invalid JSON list from {self.resp.url}"
+                )
+            buffer = buffer[position:]
+            position = 0
+            chunk = await self._read(content, self.chunk_size)
+            eof = not chunk
+            buffer += utf8.decode(chunk, eof)
+
+
+async def read_json(resp):
+    """Equivalent of ``resp.json()`` that parses the lists incrementally."""
+    stream = JsonListStream(resp)
+    elements = [element async for element in stream]
+    return elements if stream.is_list else stream.document
 
-async def build_full_device_list(session, url, device_list):
+
+async def read_json_with_details(session, url, resp, concurrency=None):
+    """Read a list answer and fetch the details of the IDs it contains.
+
+    The details of each ID are fetched as soon as the ID is parsed, while the
+    rest of the list is still being read, with at most ``concurrency``
+    requests in flight. The list keeps its connection until its end, so
+    the fetches use the other connections of the session: when there is no
+    spare one, the whole list is read first. The IDs are replaced by their
+    details (None if they cannot be fetched) and the order of the list is
+    preserved. The other documents are returned as they are.
+    """
     import asyncio
 
+    if not concurrency:
+        concurrency = max_concurrency(session)
+    connections = connection_limit(session)
+    if connections:
+        concurrency = min(concurrency, connections - 1)
+    if concurrency < 1:
+        document = await read_json(resp)
+        if not isinstance(document, list):
+            return document
+        ids = [(i, e) for i, e in enumerate(document) if isinstance(e, str)]
+        async for index, device in iter_device_info(
+            session, url, [e for _, e in ids], concurrency=connections
+        ):
+            document[ids[index][0]] = device["value"] if device else None
+        return document
+
+    semaphore = asyncio.Semaphore(concurrency)
+    elements = []
+    tasks = []
+
+    async def fetch(index, _id):
+        try:
+            device = await get_device_info(session, url, _id)
+            elements[index] = device["value"] if device else None
+        finally:
+            semaphore.release()
+
+    stream = JsonListStream(resp)
+    try:
+        async for element in stream:
+            if not isinstance(element, str):
+                elements.append(element)
+                continue
+            elements.append(None)
+            # Stop reading the list while all the slots are busy
+            await semaphore.acquire()
+            tasks.append(asyncio.ensure_future(fetch(len(elements) - 1, element)))
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return elements if stream.is_list else stream.document
+
+
+def _device_ids(device_list):
+    """Return the IDs of a device list, or None if it already has the details."""
     device_ids = []
 
     if isinstance(device_list, list):
@@ -294,14 +1474,85 @@ async def build_full_device_list(session, url, device_list):
         fields = list(i.values())
         if len(fields) != 1:
             # The list already comes with all the details
-            return device_list
+            return None
         device_ids.append(fields[0])
+    return device_ids
+
+
+def connection_limit(session):
+    """Number of connections a session may open on the vCenter, 0 if unbounded.
+
+    This is the lowest of the ``limit`` and ``limit_per_host`` of the
+    connector, all the requests of a session go to the same host.
+    """
+    connector = getattr(session, "_connector", None)
+    limits = [getattr(connector, k, 0) for k in ("limit", "limit_per_host")]
+    limits = [i for i in limits if i]
+    return min(limits) if limits else 0
+
+
+def max_concurrency(session=None):
+    """Maximum number of parallel requests a fan-out may issue on a vCenter."""
+    limit = getattr(session, "max_concurrency", None)
+    if not limit:
+        limit = int(os.environ.get("VMWARE_MAX_CONCURRENT_REQUESTS", 20))
+    return max(limit, 1)
+
+
+async def iter_device_info(session, url, device_ids, concurrency=None):
+    """Fetch the devices and yield ``(index, device)`` as they complete.
+
+    Only ``concurrency`` requests are in flight at any time, so the memory
+    usage does not grow with the number of devices.
+    """
+    import asyncio
+
+    if not concurrency:
+        concurrency = max_concurrency(session)
+    queue = asyncio.Queue()
+    pending = iter(enumerate(device_ids))
 
-    tasks = [
-        asyncio.ensure_future(get_device_info(session, url, _id)) for _id in device_ids
-    ]
+    async def worker():
+        for index, _id in pending:
+            queue.put_nowait((index, await get_device_info(session, url, _id)))
 
-    return [await i for i in tasks]
+    async def run_workers():
+        workers = [
+            asyncio.ensure_future(worker())
+            for _ in range(min(concurrency, len(device_ids)))
+        ]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for w in workers:
+                w.cancel()
+            queue.put_nowait(None)
+
+    runner = asyncio.ensure_future(run_workers())
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            yield item
+        # Propagate the exceptions raised by the workers
+        await runner
+    finally:
+        if not runner.done():
+            runner.cancel()
+
+
+async def build_full_device_list(session, url, device_list, concurrency=None):
+    device_ids = _device_ids(device_list)
+    if device_ids is None:
+        return device_list
+
+    full_devices = [None] * len(device_ids)
+    async for index, device in iter_device_info(
+        session, url, device_ids, concurrency=concurrency
+    ):
+        full_devices[index] = device
+    return full_devices
 
 
 async def get_device_info(session, url, _id):
@@ -359,12 +1610,766 @@ async def exists(
 
     uniquity_keys += ["label", "pci_slot_number", "sata"]
 
-    devices = await list_devices(session, url)
-    full_devices = await build_full_device_list(session, per_id_url, devices)
+    devices = _device_index(url).listing
+    if devices is None:
+        devices = await list_devices(session, url)
+    device_ids = _device_ids(devices)
+    if device_ids is None:
+        # The list already comes with all the details
+        for device in devices:
+            if comp_func(device):
+                return device
+        return
+
+    device_ids = [str(i) for i in device_ids]
+    index = _device_index(per_id_url)
+
+    # The devices are checked in the order of the list, the first one that
+    # matches wins, like when all the details were fetched first.
+    fetched = {i: index.devices[i] for i in device_ids if i in index.devices}
+    to_fetch = [i for i in device_ids if i not in fetched]
+    position = 0
+
+    def next_match():
+        # Check the devices in order, as soon as they are available
+        nonlocal position
+        while position < len(device_ids) and device_ids[position] in fetched:
+            device = fetched[device_ids[position]]
+            position += 1
+            if device and comp_func(device):
+                return device
+
+    device = next_match()
+    if device or not to_fetch:
+        return device
+
+    # The details are fetched by batches of 1, 2, 4... devices, up to the
+    # concurrency limit, so a match at the top of the list does not cost a
+    # full fan-out.
+    start, size = 0, 1
+    while start < len(to_fetch):
+        batch = to_fetch[start : start + size]
+        devices_info = iter_device_info(
+            session, per_id_url, batch, concurrency=len(batch)
+        )
+        try:
+            async for i, device in devices_info:
+                index.add(batch[i], device)
+                fetched[batch[i]] = device
+                device = next_match()
+                if device:
+                    # The pending requests are cancelled by aclose()
+                    return device
+        finally:
+            await devices_info.aclose()
+        start += size
+        size = min(size * 2, max_concurrency(session))
+
+
+class _DeviceIndex:
+    """The device details fetched by exists() during a module run.
+
+    ``devices`` maps the ID of a device to its details. ``listing``, when
+    set, is the list of the devices that exists() uses instead of listing
+    them again, see run_device_batch().
+    """
+
+    def __init__(self):
+        self.devices = {}
+        self.listing = None
+
+    def add(self, _id, device):
+        if device:
+            self.devices[_id] = device
+
+
+# The _DeviceIndex of the current module run, by URL
+_device_indexes = ContextVar("vmware_rest_device_indexes", default=None)
+
+
+def _device_index(url):
+    indexes = _device_indexes.get()
+    if indexes is None:
+        indexes = {}
+        _device_indexes.set(indexes)
+    if url not in indexes:
+        indexes[url] = _DeviceIndex()
+    return indexes[url]
+
+
+class _DocumentCache:
+    """A small LRU cache of JSON documents, by URL, with a TTL."""
+
+    def __init__(self, ttl, max_size):
+        import collections
+
+        self.ttl = ttl
+        self.max_size = max_size
+        self._documents = collections.OrderedDict()
+
+    def get(self, url):
+        entry = self._documents.get(url)
+        if entry is None:
+            return None
+        timestamp, document = entry
+        if time.monotonic() - timestamp > self.ttl:
+            del self._documents[url]
+            return None
+        self._documents.move_to_end(url)
+        return document
+
+    def set(self, url, document):
+        self._documents[url] = (time.monotonic(), document)
+        self._documents.move_to_end(url)
+        while len(self._documents) > self.max_size:
+            self._documents.popitem(last=False)
+
+    def invalidate(self, url):
+        """Drop the documents of ``url``, of its parents and of its children."""
+        url = str(url).split("?")[0].rstrip("/")
+        for k in list(self._documents):
+            path = k.split("?")[0].rstrip("/")
+            if url == path or url.startswith(path + "/") or path.startswith(url + "/"):
+                del self._documents[k]
+
+
+def _vm_document_url(params):
+    return "https://{vcenter_hostname}/api/vcenter/vm/{vm}".format(**params)
+
+
+# The VM documents read by the current module run, see _vm_documents()
+_run_vm_documents = ContextVar("vmware_rest_vm_documents", default=None)
+
+
+def _vm_documents(session):
+    # By default a document is only reused within the module run: the other
+    # clients of the vCenter may change the VM at any time. With
+    # VMWARE_VM_DOCUMENT_TTL, the documents are shared by the runs of the
+    # session, for that many seconds.
+    max_size = _setting(None, "VMWARE_VM_DOCUMENT_CACHE_SIZE", 1024, int)
+    ttl = _setting(None, "VMWARE_VM_DOCUMENT_TTL", 0.0, float)
+    if ttl <= 0:
+        documents = _run_vm_documents.get()
+        if documents is None:
+            documents = _DocumentCache(ttl=float("inf"), max_size=max_size)
+            _run_vm_documents.set(documents)
+        return documents
+    if getattr(session, "vm_documents", None) is None:
+        session.vm_documents = _DocumentCache(ttl=ttl, max_size=max_size)
+    return session.vm_documents
+
+
+def cache_vm_document(session, params, document):
+    """Keep a /api/vcenter/vm/{vm} document for the hardware _info modules."""
+    _vm_documents(session).set(_vm_document_url(params), document)
 
-    for device in full_devices:
-        if comp_func(device):
-            return device
+
+async def get_vm_document(session, params):
+    """Return the /api/vcenter/vm/{vm} document, from the cache if possible."""
+    url = _vm_document_url(params)
+    document = _vm_documents(session).get(url)
+    if document is not None:
+        return document
+    async with session.get(url, **session_timeout(params)) as resp:
+        if resp.status != 200:
+            return None
+        document = await resp.json()
+    if "value" in document:  # 7.0.2 <
+        document = document["value"]
+    cache_vm_document(session, params, document)
+    return document
+
+
+async def vm_document_info(session, params, key=None, id_key=None):
+    """Build the answer of a VM _info module from the VM document.
+
+    The /api/vcenter/vm/{vm} document comes with all the devices of the VM,
+    one GET is enough to serve all the vcenter_vm_hardware_*_info modules.
+    ``key`` is the section of the document (e.g: disks) and ``id_key``
+    the parameter that holds the device ID (e.g: disk).
+    Returns None if the document cannot be used, the caller should then
+    query the regular end-point.
+    """
+    if not params.get("vm"):
+        return None
+    document = await get_vm_document(session, params)
+    if document is None:
+        return None
+    if key is None:
+        return {"value": document, "id": params["vm"]}
+    value = document.get(key)
+    if value is None:
+        return None
+    if id_key is None:
+        return {"value": value}
+
+    if params.get(id_key):
+        if params[id_key] not in value:
+            return None
+        return {"value": value[params[id_key]], "id": params[id_key]}
+    if params.get("label"):
+        for _id, device in value.items():
+            if device.get("label") == params["label"]:
+                return {"value": device, "id": _id}
+        return {"value": {}}
+    # Same shape as the regular end-point, that lists the device summaries
+    return {"value": [{id_key: _id} for _id in value]}
+
+
+async def run_device_batch(params, session, url, id_key, functions, devices):
+    """Apply a list of device specs to a VM in one module call.
+
+    The devices of the VM are listed and fetched once, then each spec of
+    ``devices`` is matched, by ``id_key`` or by label, to decide if it has
+    to be created, updated or deleted. ``functions`` maps the operations
+    (create, update, delete, and the other states) to the module functions.
+    The specs are applied in parallel, within a limit. The functions find
+    the devices in the _DeviceIndex, they do not list them again.
+    """
+    import asyncio
+
+    exceptions = importlib.import_module(
+        "ansible_collections.cloud.common.plugins.module_utils.turbo.exceptions"
+    )
+    if params.get(id_key) or params.get("label"):
+        raise exceptions.EmbeddedModuleFailure(
+            f"devices is mutually exclusive with {id_key} and label"
+        )
+
+    listing = await list_devices(session, url)
+    existing = await build_full_device_list(session, url, listing)
+    index = _device_index(url)
+    by_id = {}
+    by_label = {}
+    for device in existing or []:
+        if not isinstance(device, dict) or "id" not in device:
+            continue
+        index.add(device["id"], device)
+        by_id[device["id"]] = device
+        if device["value"].get("label"):
+            by_label[device["value"]["label"]] = device
+
+    # The connection and the VM are shared by all the devices
+    allowed = {
+        k
+        for k in params
+        if not k.startswith("vcenter_")
+        and k not in ("devices", "session_timeout", "vm")
+    }
+    plans = []
+    for spec in devices:
+        unknown = set(spec) - allowed
+        if unknown:
+            raise exceptions.EmbeddedModuleFailure(
+                "Unsupported device parameters: {0}".format(", ".join(sorted(unknown)))
+            )
+        item = dict(params, devices=None)
+        item.update({k: v for k, v in spec.items() if v is not None})
+        device = by_id.get(str(item.get(id_key))) or by_label.get(item.get("label"))
+        if device:
+            item[id_key] = device["id"]
+
+        state = item.get("state") or "present"
+        if state == "present":
+            operation = "update" if device else "create"
+        elif state == "absent":
+            operation = "delete" if device else None
+        else:
+            operation = state
+        if operation and operation not in functions:
+            raise exceptions.EmbeddedModuleFailure(f"Unsupported state: {state}")
+        plans.append((operation, item))
+
+    limit = _setting(None, "VMWARE_DEVICE_BATCH_CONCURRENCY", 4, int)
+    semaphore = asyncio.Semaphore(max(limit, 1))
+
+    async def apply(operation, item):
+        if operation is None:
+            # Already absent
+            return {"value": {}, "changed": False, "failed": False}
+        async with semaphore:
+            return await functions[operation](item, session)
+
+    index.listing = listing
+    try:
+        results = await asyncio.gather(*[apply(op, item) for op, item in plans])
+    finally:
+        # The devices change, the next calls must list them again
+        index.listing = None
+    return with_perf(
+        {
+            "value": _without_perf(results),
+            "changed": any(r.get("changed") for r in results),
+            "failed": any(r.get("failed") for r in results),
+        }
+    )
+
+
+def _without_perf(results):
+    # The summary is given once, for the whole batch
+    for result in results:
+        result.pop("_perf", None)
+    return results
+
+
+# The filters of /api/vcenter/vm, the same as vcenter_vm_info
+VM_LIST_FILTERS = [
+    "clusters",
+    "datacenters",
+    "folders",
+    "hosts",
+    "names",
+    "resource_pools",
+]
+
+
+# The placement keys of a VM and the matching /api/vcenter/vm filters
+VM_PLACEMENT_FILTERS = {
+    "folder": "folders",
+    "host": "hosts",
+    "cluster": "clusters",
+    "resource_pool": "resource_pools",
+}
+
+
+def vm_scope(params):
+    """Return the /api/vcenter/vm filters where a VM name is meaningful.
+
+    A VM name is only unique in its folder. Without a folder, a host, a
+    cluster or a resource pool still bounds the search to a datacenter.
+    Returns None if the placement sets none of them: the name alone could
+    match a VM anywhere in the vCenter.
+    """
+    placement = params.get("placement") or {}
+    scope = {
+        f: [placement[k]] for k, f in VM_PLACEMENT_FILTERS.items() if placement.get(k)
+    }
+    return scope or None
+
+
+async def find_vm(params, session):
+    """Look for the VM called ``name`` in its ``placement``.
+
+    The name and the placement are passed as filters to /api/vcenter/vm,
+    so vCenter returns the few candidates instead of the full list of VMs.
+    A VM may have been moved to another host or resource pool since it has
+    been created, if nothing matches these filters we try again with the
+    name and the folder only. The search is never extended to the whole
+    vCenter, see vm_scope(). Returns the details of the VM if a single one
+    matches.
+    """
+    scope = vm_scope(params)
+    if scope is None:
+        return None
+    query = {"names": [params["name"]], **scope}
+    url = "https://{vcenter_hostname}/api/vcenter/vm".format(**params)
+
+    attempts = [query]
+    if "folders" in query and set(query) - {"names", "folders"}:
+        attempts.append({k: v for k, v in query.items() if k in ("names", "folders")})
+    for query in attempts:
+        async with session.get(
+            url + gen_args(query, query.keys()), **session_timeout(params)
+        ) as resp:
+            if resp.status != 200:
+                return None
+            _json = await resp.json()
+        if isinstance(_json, dict):  # 7.0.2 <
+            _json = _json["value"]
+        if len(_json) == 1:
+            return await get_device_info(session, url, _json[0]["vm"])
+        if _json:
+            # Ambiguous, the name is only unique in a folder
+            return None
+
+
+async def list_vm_ids(session, params):
+    """Return the IDs of the VMs matching the vcenter_vm_info-style filters."""
+    url = "https://{vcenter_hostname}/api/vcenter/vm".format(**params) + gen_args(
+        params, VM_LIST_FILTERS + ["vms"]
+    )
+    async with session.get(url, **session_timeout(params)) as resp:
+        _json = await resp.json()
+        if resp.status != 200:
+            exceptions = importlib.import_module(
+                "ansible_collections.cloud.common.plugins.module_utils.turbo.exceptions"
+            )
+            raise exceptions.EmbeddedModuleFailure(
+                f"Cannot list the VMs: status={resp.status}, {_json}"
+            )
+    if isinstance(_json, dict):  # 7.0.2 <
+        _json = _json["value"]
+    return [i["vm"] for i in _json]
+
+
+async def run_vm_bulk_action(params, session, func):
+    """Run a per-VM function on all the VMs selected by ``vms`` or the filters.
+
+    The calls are done in parallel within the session concurrency limit.
+    The result has the outcome and the duration of every VM.
+    """
+    import asyncio
+
+    start = time.monotonic()
+    if any(params.get(k) for k in VM_LIST_FILTERS):
+        vm_ids = await list_vm_ids(session, params)
+    else:
+        vm_ids = list(dict.fromkeys(params.get("vms") or []))
+    semaphore = asyncio.Semaphore(max_concurrency(session))
+
+    async def run(vm):
+        async with semaphore:
+            vm_start = time.monotonic()
+            try:
+                result = await func(dict(params, vm=vm), session)
+            except Exception as e:
+                result = {"failed": True, "changed": False, "msg": str(e)}
+            result["vm"] = vm
+            result["elapsed"] = round(time.monotonic() - vm_start, 3)
+            return result
+
+    results = await asyncio.gather(*[run(vm) for vm in vm_ids])
+    return with_perf(
+        {
+            "value": _without_perf(results),
+            "changed": any(r.get("changed") for r in results),
+            "failed": any(r.get("failed") for r in results),
+            "elapsed": round(time.monotonic() - start, 3),
+        }
+    )
+
+
+class TaskPoller:
+    """Wait for many vCenter tasks with one request per polling interval.
+
+    The operations started with ``vmw-task=true`` return a task ID instead
+    of holding the connection until the end of the operation. All the tasks
+    awaited on a session are watched together with the
+    /api/cis/tasks?tasks=... list end-point, bypassing the response cache.
+    The interval starts at ``min_interval`` and grows up to ``max_interval``
+    while no task completes. A task that vCenter does not know fails.
+    """
+
+    FINAL_STATUSES = ("SUCCEEDED", "FAILED")
+
+    def __init__(self, session, vcenter_hostname, min_interval=None, max_interval=None):
+        self.session = session
+        self.url = f"https://{vcenter_hostname}/api/cis/tasks"
+        self.min_interval = _setting(
+            min_interval, "VMWARE_TASK_POLL_INTERVAL", 1.0, float
+        )
+        self.max_interval = max(
+            _setting(max_interval, "VMWARE_TASK_POLL_MAX_INTERVAL", 10.0, float),
+            self.min_interval,
+        )
+        self._waiters = {}
+        self._runner = None
+
+    @classmethod
+    def get(cls, session, vcenter_hostname):
+        """Return the poller shared by all the tasks of the session."""
+        if getattr(session, "task_poller", None) is None:
+            session.task_poller = cls(session, vcenter_hostname)
+        return session.task_poller
+
+    async def wait(self, task_id, timeout=None):
+        """Return the info of the task once it has SUCCEEDED or FAILED.
+
+        Raises EmbeddedModuleFailure if the task is still running after
+        ``timeout`` seconds (VMWARE_TASK_TIMEOUT by default).
+        """
+        import asyncio
+
+        timeout = _setting(timeout, "VMWARE_TASK_TIMEOUT", 3600.0, float)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(task_id, []).append(future)
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.ensure_future(self._run())
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            exceptions = importlib.import_module(
+                "ansible_collections.cloud.common.plugins.module_utils.turbo.exceptions"
+            )
+            raise exceptions.EmbeddedModuleFailure(
+                f"The task {task_id} is not complete after {timeout} seconds"
+            )
+
+    def _resolve(self, task_id, info=None, exception=None):
+        for future in self._waiters.pop(task_id, []):
+            if future.done():
+                continue
+            if exception:
+                future.set_exception(exception)
+            else:
+                future.set_result(info)
+
+    async def _poll(self, task_ids):
+        url = self.url + "?" + urllib.parse.urlencode([("tasks", i) for i in task_ids])
+        # The status changes, it must not come from the response cache
+        async with self.session.get(url, cache=False) as resp:
+            _json = await resp.json()
+            if resp.status != 200:
+                exceptions = importlib.import_module(
+                    "ansible_collections.cloud.common.plugins.module_utils.turbo.exceptions"
+                )
+                raise exceptions.EmbeddedModuleFailure(
+                    f"Cannot get the tasks: status={resp.status}, {_json}"
+                )
+        if "value" in _json and isinstance(_json["value"], list):  # 7.0.2 <
+            _json = {i["key"]: i["value"] for i in _json["value"]}
+        return _json
+
+    async def _run(self):
+        import asyncio
+
+        interval = self.min_interval
+        while self._waiters:
+            await asyncio.sleep(interval)
+            # Drop the tasks of the callers that have been cancelled
+            for task_id, futures in list(self._waiters.items()):
+                if all(f.done() for f in futures):
+                    del self._waiters[task_id]
+            if not self._waiters:
+                break
+            task_ids = sorted(self._waiters)
+            try:
+                tasks = await self._poll(task_ids)
+            except Exception as e:
+                for task_id in list(self._waiters):
+                    self._resolve(task_id, exception=e)
+                break
+            exceptions = importlib.import_module(
+                "ansible_collections.cloud.common.plugins.module_utils.turbo.exceptions"
+            )
+            completed = False
+            for task_id in task_ids:
+                info = tasks.get(task_id)
+                if info is None:
+                    self._resolve(
+                        task_id,
+                        exception=exceptions.EmbeddedModuleFailure(
+                            f"The task {task_id} is unknown to vCenter"
+                        ),
+                    )
+                    completed = True
+                elif info.get("status") in self.FINAL_STATUSES:
+                    self._resolve(task_id, info)
+                    completed = True
+            if completed:
+                interval = self.min_interval
+            else:
+                interval = min(interval * 1.5, self.max_interval)
+
+
+async def run_as_task(params, session, url, payload, operation, fetch_url=None):
+    """POST an operation as a vCenter task (vmw-task=true).
+
+    Returns the task ID if ``wait_for_task`` is false. Otherwise, the task
+    is awaited with the shared TaskPoller and the result of the task is
+    returned like the synchronous call would have done. With ``fetch_url``,
+    the result is the ID of a new object (e.g: a VM) and its details are
+    fetched from this end-point.
+    """
+    separator = "&" if "?" in url else "?"
+    async with session.post(
+        url + separator + "vmw-task=true", json=payload, **session_timeout(params)
+    ) as resp:
+        _json = {}
+        if resp.headers.get("Content-Type", "").startswith("application/json"):
+            _json = await resp.json()
+        if resp.status not in [200, 201, 202]:
+            if "value" not in _json:  # 7.0.2
+                _json = {"value": _json}
+            return await update_changed_flag(_json, resp.status, operation)
+    task_id = _json["value"] if isinstance(_json, dict) else _json
+    if not params.get("wait_for_task", True):
+        return {"value": {"task": task_id}, "changed": True, "failed": False}
+
+    # Like a synchronous call, the operation is bound by session_timeout
+    info = await TaskPoller.get(session, params["vcenter_hostname"]).wait(
+        task_id, timeout=params.get("session_timeout")
+    )
+    if info["status"] == "FAILED":
+        _json = {"value": info.get("error") or info, "task": task_id}
+        return await update_changed_flag(_json, 500, operation)
+    result = info.get("result")
+    if fetch_url and isinstance(result, str):
+        _json = await get_device_info(session, fetch_url, result)
+        if _json:
+            _json["task"] = task_id
+            return await update_changed_flag(_json, 200, operation)
+    return await update_changed_flag({"value": result, "task": task_id}, 200, operation)
+
+
+def _provisioning_slots(item):
+    """Return the datastore and the host where a new VM will be placed."""
+    placement = item.get("placement") or {}
+    datastore = placement.get("datastore")
+    for k in ("vm_home_storage", "disk_storage"):
+        if not datastore and isinstance(item.get(k), dict):
+            datastore = item[k].get("datastore")
+    return datastore, placement.get("host")
+
+
+async def run_provisioning_batch(params, session, func, targets):
+    """Create many VMs (clone or deploy) in one module call.
+
+    Each element of ``targets`` is a set of module parameters, the module
+    level values being the defaults. Each target needs a placement scope
+    (see vm_scope()), so that a new run finds the VMs it has created: they
+    are looked up with one /api/vcenter/vm?names=... call per scope,
+    instead of a scan of all the VMs for each target. Two targets with the
+    same name must be in different folders. ``func`` creates a VM, the calls run in
+    parallel within the session concurrency limit and within a budget per
+    datastore (VMWARE_PROVISION_PER_DATASTORE) and per host
+    (VMWARE_PROVISION_PER_HOST). The result has the outcome and the duration
+    of every target, and a ``progress`` summary.
+    """
+    import asyncio
+
+    exceptions = importlib.import_module(
+        "ansible_collections.cloud.common.plugins.module_utils.turbo.exceptions"
+    )
+    start = time.monotonic()
+    allowed = {
+        k
+        for k in params
+        if not k.startswith("vcenter_")
+        and k not in ("session_timeout", "state", "targets")
+    }
+    items = []
+    for spec in targets:
+        unknown = set(spec) - allowed
+        if unknown:
+            raise exceptions.EmbeddedModuleFailure(
+                "Unsupported target parameters: {0}".format(", ".join(sorted(unknown)))
+            )
+        item = dict(params, targets=None)
+        item.update({k: v for k, v in spec.items() if v is not None})
+        if not item.get("name"):
+            raise exceptions.EmbeddedModuleFailure("Each target needs a name")
+        if vm_scope(item) is None:
+            # It would be created again on every run
+            raise exceptions.EmbeddedModuleFailure(
+                f"The target {item['name']} needs a folder, a host, a cluster or a "
+                "resource pool in its placement"
+            )
+        items.append(item)
+
+    # Two targets with the same name would race, unless they are in two
+    # different folders
+    folders = {}
+    for item in items:
+        folder = (item.get("placement") or {}).get("folder")
+        for other in folders.get(item["name"], []):
+            if not folder or not other or folder == other:
+                raise exceptions.EmbeddedModuleFailure(
+                    f"Duplicate target: {item['name']}"
+                )
+        folders.setdefault(item["name"], []).append(folder)
+
+    # One existence check per scope (usually a folder), see vm_scope()
+    def scope_key(item):
+        return tuple(sorted((k, v[0]) for k, v in vm_scope(item).items()))
+
+    by_scope = {}
+    for item in items:
+        by_scope.setdefault(scope_key(item), set()).add(item["name"])
+    existing = {}
+    for key, names in by_scope.items():
+        query = {"names": sorted(names)}
+        query.update({k: [v] for k, v in key})
+        url = "https://{vcenter_hostname}/api/vcenter/vm".format(**params) + gen_args(
+            query, query.keys()
+        )
+        async with session.get(url, **session_timeout(params)) as resp:
+            _json = await resp.json()
+            if resp.status != 200:
+                raise exceptions.EmbeddedModuleFailure(
+                    f"Cannot list the VMs: status={resp.status}, {_json}"
+                )
+        if isinstance(_json, dict):  # 7.0.2 <
+            _json = _json["value"]
+        for vm in _json:
+            existing.setdefault((key, vm["name"]), []).append(vm)
+
+    global_limit = asyncio.Semaphore(max_concurrency(session))
+    per_datastore = _setting(None, "VMWARE_PROVISION_PER_DATASTORE", 4, int)
+    per_host = _setting(None, "VMWARE_PROVISION_PER_HOST", 4, int)
+    budgets = {}
+
+    def budget(kind, key, limit):
+        if not key:
+            return None
+        if (kind, key) not in budgets:
+            budgets[(kind, key)] = asyncio.Semaphore(max(limit, 1))
+        return budgets[(kind, key)]
+
+    async def provision(item):
+        vms = existing.get((scope_key(item), item["name"]), [])
+        if len(vms) > 1:
+            # Without a folder, the name may be used twice in the scope
+            return {
+                "failed": True,
+                "changed": False,
+                "msg": f"Several virtual machines are called {item['name']}: "
+                + ", ".join(vm["vm"] for vm in vms),
+            }
+        if vms:
+            return {
+                "value": vms[0],
+                "id": vms[0]["vm"],
+                "changed": False,
+                "failed": False,
+            }
+        datastore, host = _provisioning_slots(item)
+        # Always taken in the same order: datastore, host, then the session
+        semaphores = [
+            budget("datastore", datastore, per_datastore),
+            budget("host", host, per_host),
+            global_limit,
+        ]
+        acquired = []
+        try:
+            for semaphore in semaphores:
+                if semaphore:
+                    await semaphore.acquire()
+                    acquired.append(semaphore)
+            return await func(item, session)
+        except Exception as e:
+            return {"failed": True, "changed": False, "msg": str(e)}
+        finally:
+            for semaphore in acquired:
+                semaphore.release()
+
+    async def run(item):
+        item_start = time.monotonic()
+        result = await provision(item)
+        if "changed" not in result:  # e.g: deploy
+            result["changed"] = not result.get("failed")
+            result.setdefault("failed", False)
+        result["name"] = item["name"]
+        result["elapsed"] = round(time.monotonic() - item_start, 3)
+        return result
+
+    results = await asyncio.gather(*[run(item) for item in items])
+    return with_perf(
+        {
+            "value": _without_perf(results),
+            "changed": any(r["changed"] for r in results),
+            "failed": any(r["failed"] for r in results),
+            "progress": {
+                "total": len(results),
+                "created": len([r for r in results if r["changed"]]),
+                "existing": len(
+                    [r for r in results if not (r["changed"] or r["failed"])]
+                ),
+                "failed": len([r for r in results if r["failed"]]),
+            },
+            "elapsed": round(time.monotonic() - start, 3),
+        }
+    )
 
 
 def set_subkey(root, path, value):
@@ -388,6 +2393,27 @@ def prepare_payload(params, payload_format):
     return payload
 
 
+def merge_update(value, payload):
+    """Return the state of a resource after an update, without a new GET.
+
+    ``value`` is the state read before the update and ``payload`` the
+    changes that have been applied.
+    """
+    if (
+        isinstance(payload, dict)
+        and list(payload.keys()) == ["spec"]
+        and isinstance(value, dict)
+        and "spec" not in value
+    ):
+        payload = payload["spec"]
+    if not isinstance(value, dict) or not isinstance(payload, dict):
+        return payload
+    merged = dict(value)
+    for k, v in payload.items():
+        merged[k] = merge_update(merged[k], v) if k in merged else v
+    return merged
+
+
 def get_subdevice_type(url):
     """If url needs a subkey, return its name."""
     candidates = []
@@ -17,6 +17,16 @@ options:
         - FIPS setting state.
         - If unset, the value is unchanged.
         type: bool
+    return_fresh_state:
+        default: false
+        description:
+        - When vCenter does not return the new state of an updated resource, the
+            new state is built from the state read before the update and the applied
+            changes, without a new request.
+        - Set to C(true) to fetch the new state from vCenter with a C(GET) request
+            instead.
+        type: bool
+        version_added: 4.0.0
     session_timeout:
         description:
         - 'Timeout settings for client session. '
@@ -105,6 +115,7 @@ except ImportError:
     from ansible.module_utils.basic import AnsibleModule
 
 from ansible_collections.vmware.vmware_rest.plugins.module_utils.vmware_rest import (
+    merge_update,
     open_session,
     prepare_payload,
     session_timeout,
@@ -149,6 +160,7 @@ def prepare_argument_spec():
     }
 
     argument_spec["enabled"] = {"type": "bool"}
+    argument_spec["return_fresh_state"] = {"default": False, "type": "bool"}
     argument_spec["state"] = {
         "type": "str",
         "choices": ["present"],
@@ -249,11 +261,16 @@ async def _update(params, session):
             _json = {"value": _json}
 
         # e.g: content_configuration
-        if not _json and resp.status == 204:
-            async with session.get(_url, **session_timeout(params)) as resp_get:
-                _json_get = await resp_get.json()
-                if _json_get:
-                    _json = _json_get
+        if not _json["value"] and resp.status == 204:
+            if params.get("return_fresh_state"):
+                async with session.get(_url, **session_timeout(params)) as resp_get:
+                    _json_get = await resp_get.json()
+                    if _json_get:
+                        if "value" not in _json_get:  # 7.0.2+
+                            _json_get = {"value": _json_get}
+                        _json = _json_get
+            else:
+                _json = {"value": merge_update(value, payload)}
 
         _json["id"] = params.get("None")
         return await update_changed_flag(_json, resp.status, "update")
@@ -200,6 +200,7 @@ from ansible_collections.vmware.vmware_rest.plugins.module_utils.vmware_rest imp
     exists,
     gen_args,
     open_session,
+    read_json_with_details,
     session_timeout,
     update_changed_flag,
 )
@@ -297,7 +298,11 @@ def build_url(params):
 async def entry_point(module, session):
     url = build_url(module.params)
     async with session.get(url, **session_timeout(module.params)) as resp:
-        _json = await resp.json()
+        if module.params.get("library_item_id") or module.params.get("label"):
+            _json = await resp.json()
+        else:
+            # the details of the IDs are fetched while the list is read
+            _json = await read_json_with_details(session, str(url), resp)
 
         if "value" not in _json:  # 7.0.2+
             _json = {"value": _json}
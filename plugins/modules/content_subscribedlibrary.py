@@ -111,6 +111,16 @@ options:
             by a remote file system, the library JSON file will be stored at {library_id}/lib.json
             in the remote file system path. ([''present''])'
         type: dict
+    return_fresh_state:
+        default: false
+        description:
+        - When vCenter does not return the new state of an updated resource, the
+            new state is built from the state read before the update and the applied
+            changes, without a new request.
+        - Set to C(true) to fetch the new state from vCenter with a C(GET) request
+            instead.
+        type: bool
+        version_added: 4.0.0
     security_policy_id:
         description:
         - 'Represents the security policy applied to this library. Setting the field
@@ -528,6 +538,7 @@ from ansible_collections.vmware.vmware_rest.plugins.module_utils.vmware_rest imp
     gen_args,
     get_device_info,
     get_subdevice_type,
+    merge_update,
     open_session,
     prepare_payload,
     session_timeout,
@@ -581,6 +592,7 @@ def prepare_argument_spec():
     argument_spec["name"] = {"type": "str"}
     argument_spec["optimization_info"] = {"type": "dict"}
     argument_spec["publish_info"] = {"type": "dict"}
+    argument_spec["return_fresh_state"] = {"default": False, "type": "bool"}
     argument_spec["security_policy_id"] = {"type": "str"}
     argument_spec["server_guid"] = {"type": "str"}
     argument_spec["state"] = {
@@ -846,11 +858,16 @@ async def _update(params, session):
             _json = {"value": _json}
 
         # e.g: content_configuration
-        if not _json and resp.status == 204:
-            async with session.get(_url, **session_timeout(params)) as resp_get:
-                _json_get = await resp_get.json()
-                if _json_get:
-                    _json = _json_get
+        if not _json["value"] and resp.status == 204:
+            if params.get("return_fresh_state"):
+                async with session.get(_url, **session_timeout(params)) as resp_get:
+                    _json_get = await resp_get.json()
+                    if _json_get:
+                        if "value" not in _json_get:  # 7.0.2+
+                            _json_get = {"value": _json_get}
+                        _json = _json_get
+            else:
+                _json = {"value": merge_update(value, payload)}
 
         _json["id"] = params.get("library_id")
         return await update_changed_flag(_json, resp.status, "update")
@@ -175,6 +175,7 @@ except ImportError:
 from ansible_collections.vmware.vmware_rest.plugins.module_utils.vmware_rest import (
     gen_args,
     open_session,
+    read_json,
     session_timeout,
     update_changed_flag,
 )
@@ -283,7 +284,7 @@ def build_url(params):
 async def entry_point(module, session):
     url = build_url(module.params)
     async with session.get(url, **session_timeout(module.params)) as resp:
-        _json = await resp.json()
+        _json = await read_json(resp)
 
         if "value" not in _json:  # 7.0.2+
             _json = {"value": _json}
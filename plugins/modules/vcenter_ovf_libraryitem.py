@@ -88,6 +88,17 @@ options:
         - Identifier of the content library item containing the OVF package to be
             deployed. Required with I(state=['deploy', 'filter'])
         type: str
+    run_as_task:
+        default: false
+        description:
+        - Start the C(deploy) operation as a vCenter task (C(vmw-task=true)) instead
+            of waiting for the end of the operation on the HTTP request.
+        - The tasks are watched by a poller shared by the session, with one request
+            to the C(/api/cis/tasks) end-point per interval for all the tasks in progress.
+            The interval is set with the C(VMWARE_TASK_POLL_INTERVAL) and C(VMWARE_TASK_POLL_MAX_INTERVAL)
+            environment variables.
+        type: bool
+        version_added: 4.0.0
     session_timeout:
         description:
         - 'Timeout settings for client session. '
@@ -174,6 +185,16 @@ options:
         - If the value is not specified in the task, the value of environment variable
             C(VMWARE_VALIDATE_CERTS) will be used instead.
         type: bool
+    wait_for_task:
+        default: true
+        description:
+        - With I(run_as_task=true), wait for the end of the task and return its result.
+        - If false, return the ID of the task in C(value.task) as soon as the task
+            is started.
+        - The wait is bound by I(session_timeout), or else by the C(VMWARE_TASK_TIMEOUT)
+            environment variable, 3600 seconds by default.
+        type: bool
+        version_added: 4.0.0
 author:
 - Ansible Cloud Team (@ansible-collections)
 version_added: 2.0.0
@@ -316,6 +337,7 @@ from ansible_collections.vmware.vmware_rest.plugins.module_utils.vmware_rest imp
     get_subdevice_type,
     open_session,
     prepare_payload,
+    run_as_task,
     session_timeout,
     update_changed_flag,
 )
@@ -361,6 +383,7 @@ def prepare_argument_spec():
     argument_spec["create_spec"] = {"type": "dict"}
     argument_spec["deployment_spec"] = {"type": "dict"}
     argument_spec["ovf_library_item_id"] = {"type": "str"}
+    argument_spec["run_as_task"] = {"default": False, "type": "bool"}
     argument_spec["source"] = {"type": "dict"}
     argument_spec["state"] = {
         "type": "str",
@@ -368,6 +391,7 @@ def prepare_argument_spec():
         "default": "present",
     }
     argument_spec["target"] = {"required": True, "type": "dict"}
+    argument_spec["wait_for_task"] = {"default": True, "type": "bool"}
 
     return argument_spec
 
@@ -499,6 +523,8 @@ async def _deploy(params, session):
         # aa
         "/api/vcenter/ovf/library-item/{ovf_library_item_id}?action=deploy"
     ).format(**params) + gen_args(params, _in_query_parameters)
+    if params["run_as_task"]:
+        return await run_as_task(params, session, _url, payload, "deploy")
     async with session.post(_url, json=payload, **session_timeout(params)) as resp:
         try:
             if resp.headers["Content-Type"] == "application/json":
@@ -776,6 +776,17 @@ options:
         - Attempt to perform a I(power_on) after clone.
         - If unset, the virtual machine will not be powered on.
         type: bool
+    run_as_task:
+        default: false
+        description:
+        - Start the C(clone), C(instant_clone) and C(relocate) operation as a vCenter task (C(vmw-task=true)) instead
+            of waiting for the end of the operation on the HTTP request.
+        - The tasks are watched by a poller shared by the session, with one request
+            to the C(/api/cis/tasks) end-point per interval for all the tasks in progress.
+            The interval is set with the C(VMWARE_TASK_POLL_INTERVAL) and C(VMWARE_TASK_POLL_MAX_INTERVAL)
+            environment variables.
+        type: bool
+        version_added: 4.0.0
     sata_adapters:
         description:
         - List of SATA adapters.
@@ -943,6 +954,57 @@ options:
             (['present'])
         - '   This key is required with [''present''].'
         type: dict
+    targets:
+        description:
+        - A list of virtual machines to clone from I(source), in a single call. Only
+            with I(state=clone).
+        - Each element accepts the keys listed below. The module level values are
+            used as defaults.
+        - The placement of each element needs a C(folder), a C(host), a C(cluster)
+            or a C(resource_pool), the virtual machines that already exist there
+            are found with a single filtered list call and are left untouched. An element
+            fails if several of them have its I(name).
+        - Two elements can only have the same I(name) if they have a different C(placement.folder).
+        - The clones run in parallel within the session concurrency limit, with at
+            most C(VMWARE_PROVISION_PER_DATASTORE) (default 4) clones per datastore
+            and C(VMWARE_PROVISION_PER_HOST) (default 4) clones per host.
+        - The result has a I(value) key with the result and the duration of each element,
+            in the same order, and a I(progress) key with the number of created, existing
+            and failed virtual machines.
+        elements: dict
+        suboptions:
+            disks_to_remove:
+                description:
+                - Same as the module level I(disks_to_remove) option.
+                elements: str
+                type: list
+            disks_to_update:
+                description:
+                - Same as the module level I(disks_to_update) option.
+                type: dict
+            guest_customization_spec:
+                description:
+                - Same as the module level I(guest_customization_spec) option.
+                type: dict
+            name:
+                description:
+                - Same as the module level I(name) option.
+                required: true
+                type: str
+            placement:
+                description:
+                - Same as the module level I(placement) option.
+                type: dict
+            power_on:
+                description:
+                - Same as the module level I(power_on) option.
+                type: bool
+            source:
+                description:
+                - Same as the module level I(source) option.
+                type: str
+        type: list
+        version_added: 4.0.0
     vcenter_hostname:
         description:
         - The hostname or IP address of the vSphere vCenter
@@ -986,6 +1048,16 @@ options:
         - The parameter must be the id of a resource returned by M(vmware.vmware_rest.vcenter_vm_info).
             Required with I(state=['absent', 'relocate', 'unregister'])
         type: str
+    wait_for_task:
+        default: true
+        description:
+        - With I(run_as_task=true), wait for the end of the task and return its result.
+        - If false, return the ID of the task in C(value.task) as soon as the task
+            is started.
+        - The wait is bound by I(session_timeout), or else by the C(VMWARE_TASK_TIMEOUT)
+            environment variable, 3600 seconds by default.
+        type: bool
+        version_added: 4.0.0
 author:
 - Ansible Cloud Team (@ansible-collections)
 version_added: 0.1.0
@@ -1337,11 +1409,14 @@ except ImportError:
 
 from ansible_collections.vmware.vmware_rest.plugins.module_utils.vmware_rest import (
     exists,
+    find_vm,
     gen_args,
     get_device_info,
     get_subdevice_type,
     open_session,
     prepare_payload,
+    run_as_task,
+    run_provisioning_batch,
     session_timeout,
     update_changed_flag,
 )
@@ -1613,6 +1688,7 @@ def prepare_argument_spec():
     argument_spec["path"] = {"type": "str"}
     argument_spec["placement"] = {"type": "dict"}
     argument_spec["power_on"] = {"type": "bool"}
+    argument_spec["run_as_task"] = {"default": False, "type": "bool"}
     argument_spec["sata_adapters"] = {"type": "list", "elements": "dict"}
     argument_spec["scsi_adapters"] = {"type": "list", "elements": "dict"}
     argument_spec["serial_ports"] = {"type": "list", "elements": "dict"}
@@ -1632,7 +1708,22 @@ def prepare_argument_spec():
         "default": "present",
     }
     argument_spec["storage_policy"] = {"type": "dict"}
+    argument_spec["targets"] = {
+        "elements": "dict",
+        # No defaults: the module level values are the defaults
+        "options": {
+            "disks_to_remove": {"type": "list", "elements": "str"},
+            "disks_to_update": {"type": "dict"},
+            "guest_customization_spec": {"type": "dict"},
+            "name": {"required": True, "type": "str"},
+            "placement": {"type": "dict"},
+            "power_on": {"type": "bool"},
+            "source": {"type": "str"},
+        },
+        "type": "list",
+    }
     argument_spec["vm"] = {"type": "str"}
+    argument_spec["wait_for_task"] = {"default": True, "type": "bool"}
 
     return argument_spec
 
@@ -1670,6 +1761,13 @@ def build_url(params):
 
 
 async def entry_point(module, session):
+    if module.params["targets"]:
+        if module.params["state"] != "clone":
+            raise EmbeddedModuleFailure("targets is only supported with state=clone")
+        return await run_provisioning_batch(
+            module.params, session, _do_clone, module.params["targets"]
+        )
+
     if module.params["state"] == "present":
         if "_create" in globals():
             operation = "create"
@@ -1686,10 +1784,6 @@ async def entry_point(module, session):
 
 
 async def _clone(params, session):
-    lookup_url = per_id_url = build_url(params)
-    uniquity_keys = ["vm"]
-    comp_func = None
-
     async def lookup_with_filters(params, session, url):
         # e.g: for the datacenter resources
         if "folder" not in params:
@@ -1708,15 +1802,9 @@ async def _clone(params, session):
     if params["vm"]:
         _json = await get_device_info(session, build_url(params), params["vm"])
 
-    if not _json and (uniquity_keys or comp_func):
-        _json = await exists(
-            params,
-            session,
-            url=lookup_url,
-            uniquity_keys=uniquity_keys,
-            per_id_url=per_id_url,
-            comp_func=comp_func,
-        )
+    if not _json and params["name"]:
+        # Filter on the name and the placement instead of fetching all the VMs
+        _json = await find_vm(params, session)
 
     if not _json:
         _json = await lookup_with_filters(params, session, build_url(params))
@@ -1730,10 +1818,19 @@ async def _clone(params, session):
 
         return await update_changed_flag(_json, 200, "get")
 
+    return await _do_clone(params, session)
+
+
+async def _do_clone(params, session):
+    # The clone itself, once we know that the VM does not exist yet
     payload = prepare_payload(params, PAYLOAD_FORMAT["clone"])
     _url = ("https://{vcenter_hostname}" "/api/vcenter/vm?action=clone").format(
         **params
     )
+    if params["run_as_task"]:
+        return await run_as_task(
+            params, session, _url, payload, "clone", fetch_url=_url
+        )
     async with session.post(_url, json=payload, **session_timeout(params)) as resp:
         if resp.status == 500:
             text = await resp.text()
@@ -1761,10 +1858,6 @@ async def _clone(params, session):
 
 
 async def _create(params, session):
-    lookup_url = per_id_url = build_url(params)
-    uniquity_keys = ["vm"]
-    comp_func = None
-
     async def lookup_with_filters(params, session, url):
         # e.g: for the datacenter resources
         if "folder" not in params:
@@ -1783,15 +1876,9 @@ async def _create(params, session):
     if params["vm"]:
         _json = await get_device_info(session, build_url(params), params["vm"])
 
-    if not _json and (uniquity_keys or comp_func):
-        _json = await exists(
-            params,
-            session,
-            url=lookup_url,
-            uniquity_keys=uniquity_keys,
-            per_id_url=per_id_url,
-            comp_func=comp_func,
-        )
+    if not _json and params["name"]:
+        # Filter on the name and the placement instead of fetching all the VMs
+        _json = await find_vm(params, session)
 
     if not _json:
         _json = await lookup_with_filters(params, session, build_url(params))
@@ -1854,10 +1941,6 @@ async def _delete(params, session):
 
 
 async def _instant_clone(params, session):
-    lookup_url = per_id_url = build_url(params)
-    uniquity_keys = ["vm"]
-    comp_func = None
-
     async def lookup_with_filters(params, session, url):
         # e.g: for the datacenter resources
         if "folder" not in params:
@@ -1876,15 +1959,9 @@ async def _instant_clone(params, session):
     if params["vm"]:
         _json = await get_device_info(session, build_url(params), params["vm"])
 
-    if not _json and (uniquity_keys or comp_func):
-        _json = await exists(
-            params,
-            session,
-            url=lookup_url,
-            uniquity_keys=uniquity_keys,
-            per_id_url=per_id_url,
-            comp_func=comp_func,
-        )
+    if not _json and params["name"]:
+        # Filter on the name and the placement instead of fetching all the VMs
+        _json = await find_vm(params, session)
 
     if not _json:
         _json = await lookup_with_filters(params, session, build_url(params))
@@ -1902,6 +1979,10 @@ async def _instant_clone(params, session):
     _url = ("https://{vcenter_hostname}" "/api/vcenter/vm?action=instant-clone").format(
         **params
     )
+    if params["run_as_task"]:
+        return await run_as_task(
+            params, session, _url, payload, "instant_clone", fetch_url=_url
+        )
     async with session.post(_url, json=payload, **session_timeout(params)) as resp:
         if resp.status == 500:
             text = await resp.text()
@@ -1966,6 +2047,8 @@ async def _relocate(params, session):
         # aa
         "/api/vcenter/vm/{vm}?action=relocate"
     ).format(**params) + gen_args(params, _in_query_parameters)
+    if params["run_as_task"]:
+        return await run_as_task(params, session, _url, payload, "relocate")
     async with session.post(_url, json=payload, **session_timeout(params)) as resp:
         try:
             if resp.headers["Content-Type"] == "application/json":
@@ -30,6 +30,17 @@ options:
         - The default value is 300s.
         type: float
         version_added: 2.1.0
+    use_vm_document:
+        default: false
+        description:
+        - Take the CD-ROM devices from the C(cdroms) key of the C(/api/vcenter/vm/{vm})
+            document of the virtual machine rather than from
+            C(/api/vcenter/vm/{vm}/hardware/cdrom).
+        - No request is made if the document has already been read during the module
+            run, or within C(VMWARE_VM_DOCUMENT_TTL) seconds when this variable is set.
+            The changes made by other clients in the meantime are not seen.
+        type: bool
+        version_added: 4.0.0
     vcenter_hostname:
         description:
         - The hostname or IP address of the vSphere vCenter
@@ -139,6 +150,7 @@ from ansible_collections.vmware.vmware_rest.plugins.module_utils.vmware_rest imp
     open_session,
     session_timeout,
     update_changed_flag,
+    vm_document_info,
 )
 
 
@@ -180,6 +192,7 @@ def prepare_argument_spec():
 
     argument_spec["cdrom"] = {"type": "str"}
     argument_spec["label"] = {"type": "str"}
+    argument_spec["use_vm_document"] = {"default": False, "type": "bool"}
     argument_spec["vm"] = {"required": True, "type": "str"}
 
     return argument_spec
@@ -237,6 +250,10 @@ def build_url(params):
 
 
 async def entry_point(module, session):
+    if module.params["use_vm_document"]:
+        _json = await vm_document_info(session, module.params, "cdroms", "cdrom")
+        if _json is not None:
+            return await update_changed_flag(_json, 200, "get")
     url = build_url(module.params)
     async with session.get(url, **session_timeout(module.params)) as resp:
         _json = await resp.json()
@@ -30,6 +30,71 @@ options:
         - This field is optional and it is only relevant when the value of I(type)
             is VMDK_FILE. (['present'])
         type: dict
+    devices:
+        description:
+        - A list of disks to configure on the virtual machine I(vm), in a single call.
+        - Each element accepts the same keys as the module, except I(vm) and the connection
+            parameters. The module level values are used as defaults.
+        - An element is matched to an existing disk by its I(disk) or its I(label).
+        - The devices of the virtual machine are listed once for all the elements,
+            and the changes are applied in parallel. The environment variable
+            C(VMWARE_DEVICE_BATCH_CONCURRENCY) sets the number of parallel changes,
+            4 by default.
+        - The result has a I(value) key with the result of each element, in the same
+            order.
+        - Mutually exclusive with I(disk) and I(label).
+        elements: dict
+        suboptions:
+            backing:
+                description:
+                - Same as the module level I(backing) option.
+                type: dict
+            disk:
+                description:
+                - Same as the module level I(disk) option.
+                type: str
+            ide:
+                description:
+                - Same as the module level I(ide) option.
+                type: dict
+            label:
+                description:
+                - Same as the module level I(label) option.
+                type: str
+            new_vmdk:
+                description:
+                - Same as the module level I(new_vmdk) option.
+                type: dict
+            nvme:
+                description:
+                - Same as the module level I(nvme) option.
+                type: dict
+            sata:
+                description:
+                - Same as the module level I(sata) option.
+                type: dict
+            scsi:
+                description:
+                - Same as the module level I(scsi) option.
+                type: dict
+            state:
+                choices:
+                - absent
+                - present
+                description:
+                - Same as the module level I(state) option.
+                type: str
+            type:
+                choices:
+                - IDE
+                - NVME
+                - SATA
+                - SCSI
+                description:
+                - Same as the module level I(type) option.
+                type: str
+        type: list
+        version_added: 4.0.0
     disk:
         description:
         - Virtual disk identifier.
@@ -94,6 +159,16 @@ options:
             adapter. If there are no available connections on the adapter, the request
             will be rejected. (['present'])
         type: dict
+    return_fresh_state:
+        default: false
+        description:
+        - When vCenter does not return the new state of an updated resource, the
+            new state is built from the state read before the update and the applied
+            changes, without a new request.
+        - Set to C(true) to fetch the new state from vCenter with a C(GET) request
+            instead.
+        type: bool
+        version_added: 4.0.0
     sata:
         description:
         - Address for attaching the device to a virtual SATA adapter.
@@ -296,8 +371,10 @@ from ansible_collections.vmware.vmware_rest.plugins.module_utils.vmware_rest imp
     gen_args,
     get_device_info,
     get_subdevice_type,
+    merge_update,
     open_session,
     prepare_payload,
+    run_device_batch,
     session_timeout,
     update_changed_flag,
 )
@@ -340,11 +417,29 @@ def prepare_argument_spec():
     }
 
     argument_spec["backing"] = {"type": "dict"}
+    argument_spec["devices"] = {
+        "elements": "dict",
+        # No defaults: the module level values are the defaults
+        "options": {
+            "backing": {"type": "dict"},
+            "disk": {"type": "str"},
+            "ide": {"type": "dict"},
+            "label": {"type": "str"},
+            "new_vmdk": {"type": "dict"},
+            "nvme": {"type": "dict"},
+            "sata": {"type": "dict"},
+            "scsi": {"type": "dict"},
+            "state": {"type": "str", "choices": ["absent", "present"]},
+            "type": {"type": "str", "choices": ["IDE", "NVME", "SATA", "SCSI"]},
+        },
+        "type": "list",
+    }
     argument_spec["disk"] = {"type": "str"}
     argument_spec["ide"] = {"type": "dict"}
     argument_spec["label"] = {"type": "str"}
     argument_spec["new_vmdk"] = {"type": "dict"}
     argument_spec["nvme"] = {"type": "dict"}
+    argument_spec["return_fresh_state"] = {"default": False, "type": "bool"}
     argument_spec["sata"] = {"type": "dict"}
     argument_spec["scsi"] = {"type": "dict"}
     argument_spec["state"] = {
@@ -393,6 +488,17 @@ def build_url(params):
 
 
 async def entry_point(module, session):
+    if module.params["devices"]:
+        functions = {"create": _create, "delete": _delete, "update": _update}
+        return await run_device_batch(
+            module.params,
+            session,
+            build_url(module.params),
+            "disk",
+            functions,
+            module.params["devices"],
+        )
+
     if module.params["state"] == "present":
         if "_create" in globals():
             operation = "create"
@@ -544,11 +650,16 @@ async def _update(params, session):
             _json = {"value": _json}
 
         # e.g: content_configuration
-        if not _json and resp.status == 204:
-            async with session.get(_url, **session_timeout(params)) as resp_get:
-                _json_get = await resp_get.json()
-                if _json_get:
-                    _json = _json_get
+        if not _json["value"] and resp.status == 204:
+            if params.get("return_fresh_state"):
+                async with session.get(_url, **session_timeout(params)) as resp_get:
+                    _json_get = await resp_get.json()
+                    if _json_get:
+                        if "value" not in _json_get:  # 7.0.2+
+                            _json_get = {"value": _json_get}
+                        _json = _json_get
+            else:
+                _json = {"value": merge_update(value, payload)}
 
         _json["id"] = params.get("disk")
         return await update_changed_flag(_json, resp.status, "update")
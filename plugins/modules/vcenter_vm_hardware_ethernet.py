@@ -52,6 +52,87 @@ options:
             port will be automatically assigned to the Ethernet adapter based on the
             policy embodied by the portgroup type. (['present'])
         type: dict
+    devices:
+        description:
+        - A list of Ethernet adapters to configure on the virtual machine I(vm), in a single call.
+        - Each element accepts the same keys as the module, except I(vm) and the connection
+            parameters. The module level values are used as defaults.
+        - An element is matched to an existing Ethernet adapter by its I(nic) or its I(label).
+        - The devices of the virtual machine are listed once for all the elements,
+            and the changes are applied in parallel. The environment variable
+            C(VMWARE_DEVICE_BATCH_CONCURRENCY) sets the number of parallel changes,
+            4 by default.
+        - The result has a I(value) key with the result of each element, in the same
+            order.
+        - Mutually exclusive with I(nic) and I(label).
+        elements: dict
+        suboptions:
+            allow_guest_control:
+                description:
+                - Same as the module level I(allow_guest_control) option.
+                type: bool
+            backing:
+                description:
+                - Same as the module level I(backing) option.
+                type: dict
+            label:
+                description:
+                - Same as the module level I(label) option.
+                type: str
+            mac_address:
+                description:
+                - Same as the module level I(mac_address) option.
+                type: str
+            mac_type:
+                choices:
+                - ASSIGNED
+                - GENERATED
+                - MANUAL
+                description:
+                - Same as the module level I(mac_type) option.
+                type: str
+            nic:
+                description:
+                - Same as the module level I(nic) option.
+                type: str
+            pci_slot_number:
+                description:
+                - Same as the module level I(pci_slot_number) option.
+                type: int
+            start_connected:
+                description:
+                - Same as the module level I(start_connected) option.
+                type: bool
+            state:
+                choices:
+                - absent
+                - connect
+                - disconnect
+                - present
+                description:
+                - Same as the module level I(state) option.
+                type: str
+            type:
+                choices:
+                - E1000
+                - E1000E
+                - PCNET32
+                - VMXNET
+                - VMXNET2
+                - VMXNET3
+                description:
+                - Same as the module level I(type) option.
+                type: str
+            upt_compatibility_enabled:
+                description:
+                - Same as the module level I(upt_compatibility_enabled) option.
+                type: bool
+            wake_on_lan_enabled:
+                description:
+                - Same as the module level I(wake_on_lan_enabled) option.
+                type: bool
+        type: list
+        version_added: 4.0.0
     label:
         description:
         - The name of the item
@@ -88,6 +169,16 @@ options:
         - If unset, the server will choose an available address when the virtual machine
             is powered on.
         type: int
+    return_fresh_state:
+        default: false
+        description:
+        - When vCenter does not return the new state of an updated resource, the
+            new state is built from the state read before the update and the applied
+            changes, without a new request.
+        - Set to C(true) to fetch the new state from vCenter with a C(GET) request
+            instead.
+        type: bool
+        version_added: 4.0.0
     session_timeout:
         description:
         - 'Timeout settings for client session. '
@@ -357,8 +448,10 @@ from ansible_collections.vmware.vmware_rest.plugins.module_utils.vmware_rest imp
     gen_args,
     get_device_info,
     get_subdevice_type,
+    merge_update,
     open_session,
     prepare_payload,
+    run_device_batch,
     session_timeout,
     update_changed_flag,
 )
@@ -402,6 +495,38 @@ def prepare_argument_spec():
 
     argument_spec["allow_guest_control"] = {"type": "bool"}
     argument_spec["backing"] = {"type": "dict"}
+    argument_spec["devices"] = {
+        "elements": "dict",
+        # No defaults: the module level values are the defaults
+        "options": {
+            "allow_guest_control": {"type": "bool"},
+            "backing": {"type": "dict"},
+            "label": {"type": "str"},
+            "mac_address": {"type": "str"},
+            "mac_type": {"type": "str", "choices": ["ASSIGNED", "GENERATED", "MANUAL"]},
+            "nic": {"type": "str"},
+            "pci_slot_number": {"type": "int"},
+            "start_connected": {"type": "bool"},
+            "state": {
+                "type": "str",
+                "choices": ["absent", "connect", "disconnect", "present"],
+            },
+            "type": {
+                "type": "str",
+                "choices": [
+                    "E1000",
+                    "E1000E",
+                    "PCNET32",
+                    "VMXNET",
+                    "VMXNET2",
+                    "VMXNET3",
+                ],
+            },
+            "upt_compatibility_enabled": {"type": "bool"},
+            "wake_on_lan_enabled": {"type": "bool"},
+        },
+        "type": "list",
+    }
     argument_spec["label"] = {"type": "str"}
     argument_spec["mac_address"] = {"type": "str"}
     argument_spec["mac_type"] = {
@@ -410,6 +535,7 @@ def prepare_argument_spec():
     }
     argument_spec["nic"] = {"type": "str"}
     argument_spec["pci_slot_number"] = {"type": "int"}
+    argument_spec["return_fresh_state"] = {"default": False, "type": "bool"}
     argument_spec["start_connected"] = {"type": "bool"}
     argument_spec["state"] = {
         "type": "str",
@@ -462,6 +588,23 @@ def build_url(params):
 
 
 async def entry_point(module, session):
+    if module.params["devices"]:
+        functions = {
+            "create": _create,
+            "delete": _delete,
+            "update": _update,
+            "connect": _connect,
+            "disconnect": _disconnect,
+        }
+        return await run_device_batch(
+            module.params,
+            session,
+            build_url(module.params),
+            "nic",
+            functions,
+            module.params["devices"],
+        )
+
     if module.params["state"] == "present":
         if "_create" in globals():
             operation = "create"
@@ -667,11 +810,16 @@ async def _update(params, session):
             _json = {"value": _json}
 
         # e.g: content_configuration
-        if not _json and resp.status == 204:
-            async with session.get(_url, **session_timeout(params)) as resp_get:
-                _json_get = await resp_get.json()
-                if _json_get:
-                    _json = _json_get
+        if not _json["value"] and resp.status == 204:
+            if params.get("return_fresh_state"):
+                async with session.get(_url, **session_timeout(params)) as resp_get:
+                    _json_get = await resp_get.json()
+                    if _json_get:
+                        if "value" not in _json_get:  # 7.0.2+
+                            _json_get = {"value": _json_get}
+                        _json = _json_get
+            else:
+                _json = {"value": merge_update(value, payload)}
 
         _json["id"] = params.get("nic")
         return await update_changed_flag(_json, resp.status, "update")
@@ -84,6 +84,19 @@ options:
         - The default value is 300s.
         type: float
         version_added: 2.1.0
+    use_vm_document:
+        default: false
+        description:
+        - Reuse the C(/api/vcenter/vm/{vm}) document if it has already been read, and
+            keep it for the C(vcenter_vm_hardware_*_info) modules that have the same
+            option.
+        - Without I(vm), the option has no effect.
+        - The document is only reused within the module run, set
+            C(VMWARE_VM_DOCUMENT_TTL) to share it with the next tasks of the same
+            vCenter session for that many seconds. The changes made by other clients
+            during that time are not seen.
+        type: bool
+        version_added: 4.0.0
     vcenter_hostname:
         description:
         - The hostname or IP address of the vSphere vCenter
@@ -348,8 +361,10 @@ from ansible_collections.vmware.vmware_rest.plugins.module_utils.vmware_rest imp
     exists,
     gen_args,
     open_session,
+    read_json,
     session_timeout,
     update_changed_flag,
+    vm_document_info,
 )
 
 
@@ -408,6 +423,7 @@ def prepare_argument_spec():
     }
     argument_spec["power_states"] = {"type": "list", "elements": "str"}
     argument_spec["resource_pools"] = {"type": "list", "elements": "str"}
+    argument_spec["use_vm_document"] = {"default": False, "type": "bool"}
     argument_spec["vm"] = {"type": "str"}
     argument_spec["vms"] = {"type": "list", "elements": "str"}
 
@@ -462,9 +478,13 @@ def build_url(params):
 
 
 async def entry_point(module, session):
+    if module.params["use_vm_document"]:
+        _json = await vm_document_info(session, module.params)
+        if _json is not None:
+            return await update_changed_flag(_json, 200, "get")
     url = build_url(module.params)
     async with session.get(url, **session_timeout(module.params)) as resp:
-        _json = await resp.json()
+        _json = await read_json(resp)
 
         if "value" not in _json:  # 7.0.2+
             _json = {"value": _json}
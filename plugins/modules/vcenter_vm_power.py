@@ -15,6 +15,69 @@ description: Ask the vCenter to boot, force shutdown or force reset a guest. If
     want to do a soft shutdown or a soft reset, you can use M(vmware.vmware_rest.vmware_vm_guest_power)
     instead.
 options:
+    clusters:
+        description:
+        - Clusters that must contain the virtual machine for the virtual machine to
+            match the filter.
+        - If unset or empty, virtual machines in any cluster match the filter.
+        - When clients pass a value of this structure as a parameter, the field must
+            contain the id of resources returned by M(vmware.vmware_rest.vcenter_cluster_info).
+        - Use it to run the power action on several virtual machines, see I(vms).
+        elements: str
+        type: list
+        version_added: 4.0.0
+    datacenters:
+        description:
+        - Datacenters that must contain the virtual machine for the virtual machine
+            to match the filter.
+        - If unset or empty, virtual machines in any datacenter match the filter.
+        - When clients pass a value of this structure as a parameter, the field must
+            contain the id of resources returned by M(vmware.vmware_rest.vcenter_datacenter_info).
+        - Use it to run the power action on several virtual machines, see I(vms).
+        elements: str
+        type: list
+        version_added: 4.0.0
+    folders:
+        description:
+        - Folders that must contain the virtual machine for the virtual machine to
+            match the filter.
+        - If unset or empty, virtual machines in any folder match the filter.
+        - When clients pass a value of this structure as a parameter, the field must
+            contain the id of resources returned by M(vmware.vmware_rest.vcenter_folder_info).
+        - Use it to run the power action on several virtual machines, see I(vms).
+        elements: str
+        type: list
+        version_added: 4.0.0
+    hosts:
+        description:
+        - Hosts that must contain the virtual machine for the virtual machine to match
+            the filter.
+        - If unset or empty, virtual machines on any host match the filter.
+        - When clients pass a value of this structure as a parameter, the field must
+            contain the id of resources returned by M(vmware.vmware_rest.vcenter_host_info).
+        - Use it to run the power action on several virtual machines, see I(vms).
+        elements: str
+        type: list
+        version_added: 4.0.0
+    names:
+        description:
+        - Names that virtual machines must have to match the filter (see I(name)).
+        - If unset or empty, virtual machines with any name match the filter.
+        - Use it to run the power action on several virtual machines, see I(vms).
+        elements: str
+        type: list
+        version_added: 4.0.0
+    resource_pools:
+        description:
+        - Resource pools that must contain the virtual machine for the virtual machine
+            to match the filter.
+        - If unset or empty, virtual machines in any resource pool match the filter.
+        - When clients pass a value of this structure as a parameter, the field must
+            contain the id of resources returned by M(vmware.vmware_rest.vcenter_resourcepool_info).
+        - Use it to run the power action on several virtual machines, see I(vms).
+        elements: str
+        type: list
+        version_added: 4.0.0
     session_timeout:
         description:
         - 'Timeout settings for client session. '
@@ -73,9 +136,24 @@ options:
         description:
         - Virtual machine identifier.
         - The parameter must be the id of a resource returned by M(vmware.vmware_rest.vcenter_vm_info).
-            This parameter is mandatory.
-        required: true
+        - One of I(vm), I(vms) or a virtual machine filter is required.
+        - Mutually exclusive with I(vms) and the virtual machine filters.
         type: str
+    vms:
+        description:
+        - Identifiers of the virtual machines to run the power action on.
+        - The virtual machines can also be selected with the I(clusters), I(datacenters),
+            I(folders), I(hosts), I(names) and I(resource_pools) filters, like with
+            M(vmware.vmware_rest.vcenter_vm_info).
+        - Mutually exclusive with I(vm) and the virtual machine filters.
+        - The actions are run in parallel, the environment variable C(VMWARE_MAX_CONCURRENT_REQUESTS)
+            sets how many at a time.
+        - The result has a I(value) key with the outcome and the duration (I(elapsed))
+            of the action for each virtual machine.
+        - Mutually exclusive with I(vm).
+        elements: str
+        type: list
+        version_added: 4.0.0
 author:
 - Ansible Cloud Team (@ansible-collections)
 version_added: 0.1.0
@@ -252,11 +330,13 @@ except ImportError:
     from ansible.module_utils.basic import AnsibleModule
 
 from ansible_collections.vmware.vmware_rest.plugins.module_utils.vmware_rest import (
+    VM_LIST_FILTERS,
     exists,
     gen_args,
     get_subdevice_type,
     open_session,
     prepare_payload,
+    run_vm_bulk_action,
     session_timeout,
     update_changed_flag,
 )
@@ -298,12 +378,19 @@ def prepare_argument_spec():
         ),
     }
 
+    argument_spec["clusters"] = {"type": "list", "elements": "str"}
+    argument_spec["datacenters"] = {"type": "list", "elements": "str"}
+    argument_spec["folders"] = {"type": "list", "elements": "str"}
+    argument_spec["hosts"] = {"type": "list", "elements": "str"}
+    argument_spec["names"] = {"type": "list", "elements": "str"}
+    argument_spec["resource_pools"] = {"type": "list", "elements": "str"}
     argument_spec["state"] = {
         "required": True,
         "type": "str",
         "choices": ["reset", "start", "stop", "suspend"],
     }
-    argument_spec["vm"] = {"required": True, "type": "str"}
+    argument_spec["vm"] = {"type": "str"}
+    argument_spec["vms"] = {"type": "list", "elements": "str"}
 
     return argument_spec
 
@@ -313,7 +400,13 @@ async def main():
 
     module_args = prepare_argument_spec()
     module = AnsibleModule(
-        argument_spec=module_args, required_if=required_if, supports_check_mode=True
+        argument_spec=module_args,
+        required_if=required_if,
+        required_one_of=[["vm", "vms"] + VM_LIST_FILTERS],
+        # The filters select the VMs, they cannot be combined with vm or vms
+        mutually_exclusive=[["vm", "vms"]]
+        + [[i, j] for i in ("vm", "vms") for j in VM_LIST_FILTERS],
+        supports_check_mode=True,
     )
     if not module.params["vcenter_hostname"]:
         module.fail_json("vcenter_hostname cannot be empty")
@@ -341,6 +434,10 @@ def build_url(params):
 
 
 async def entry_point(module, session):
+    if not module.params["vm"]:
+        func = globals()["_" + module.params["state"]]
+        return await run_vm_bulk_action(module.params, session, func)
+
     if module.params["state"] == "present":
         if "_create" in globals():
             operation = "create"
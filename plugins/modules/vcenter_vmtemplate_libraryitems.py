@@ -101,6 +101,17 @@ options:
         - Specifies whether the deployed virtual machine should be powered on after
             deployment.
         type: bool
+    run_as_task:
+        default: false
+        description:
+        - Start the C(deploy) operation as a vCenter task (C(vmw-task=true)) instead
+            of waiting for the end of the operation on the HTTP request.
+        - The tasks are watched by a poller shared by the session, with one request
+            to the C(/api/cis/tasks) end-point per interval for all the tasks in progress.
+            The interval is set with the C(VMWARE_TASK_POLL_INTERVAL) and C(VMWARE_TASK_POLL_MAX_INTERVAL)
+            environment variables.
+        type: bool
+        version_added: 4.0.0
     session_timeout:
         description:
         - 'Timeout settings for client session. '
@@ -121,6 +132,64 @@ options:
         default: present
         description: []
         type: str
+    targets:
+        description:
+        - A list of virtual machines to deploy from I(template_library_item), in a
+            single call. Only with I(state=deploy).
+        - Each element accepts the keys listed below. The module level values are
+            used as defaults.
+        - The placement of each element needs a C(folder), a C(host), a C(cluster)
+            or a C(resource_pool), the virtual machines that already exist there
+            are found with a single filtered list call and are not deployed again. An element
+            fails if several of them have its I(name).
+        - Two elements can only have the same I(name) if they have a different C(placement.folder).
+        - The deployments run in parallel within the session concurrency limit, with
+            at most C(VMWARE_PROVISION_PER_DATASTORE) (default 4) deployments per datastore
+            and C(VMWARE_PROVISION_PER_HOST) (default 4) deployments per host.
+        - The result has a I(value) key with the result and the duration of each element,
+            in the same order, and a I(progress) key with the number of created, existing
+            and failed virtual machines.
+        elements: dict
+        suboptions:
+            description:
+                description:
+                - Same as the module level I(description) option.
+                type: str
+            disk_storage:
+                description:
+                - Same as the module level I(disk_storage) option.
+                type: dict
+            disk_storage_overrides:
+                description:
+                - Same as the module level I(disk_storage_overrides) option.
+                type: dict
+            guest_customization:
+                description:
+                - Same as the module level I(guest_customization) option.
+                type: dict
+            hardware_customization:
+                description:
+                - Same as the module level I(hardware_customization) option.
+                type: dict
+            name:
+                description:
+                - Same as the module level I(name) option.
+                required: true
+                type: str
+            placement:
+                description:
+                - Same as the module level I(placement) option.
+                type: dict
+            powered_on:
+                description:
+                - Same as the module level I(powered_on) option.
+                type: bool
+            vm_home_storage:
+                description:
+                - Same as the module level I(vm_home_storage) option.
+                type: dict
+        type: list
+        version_added: 4.0.0
     template_library_item:
         description:
         - identifier of the content library item containing the source virtual machine
@@ -179,6 +248,16 @@ options:
         - '       - C(USE_SPECIFIED_POLICY)'
         - '     - policy (string): Identifier for the storage policy to use.'
         type: dict
+    wait_for_task:
+        default: true
+        description:
+        - With I(run_as_task=true), wait for the end of the task and return its result.
+        - If false, return the ID of the task in C(value.task) as soon as the task
+            is started.
+        - The wait is bound by I(session_timeout), or else by the C(VMWARE_TASK_TIMEOUT)
+            environment variable, 3600 seconds by default.
+        type: bool
+        version_added: 4.0.0
 author:
 - Ansible Cloud Team (@ansible-collections)
 version_added: 2.2.0
@@ -361,6 +440,8 @@ from ansible_collections.vmware.vmware_rest.plugins.module_utils.vmware_rest imp
     get_subdevice_type,
     open_session,
     prepare_payload,
+    run_as_task,
+    run_provisioning_batch,
     session_timeout,
     update_changed_flag,
 )
@@ -411,14 +492,32 @@ def prepare_argument_spec():
     argument_spec["name"] = {"required": True, "type": "str"}
     argument_spec["placement"] = {"type": "dict"}
     argument_spec["powered_on"] = {"type": "bool"}
+    argument_spec["run_as_task"] = {"default": False, "type": "bool"}
     argument_spec["source_vm"] = {"type": "str"}
     argument_spec["state"] = {
         "type": "str",
         "choices": ["deploy", "present"],
         "default": "present",
     }
+    argument_spec["targets"] = {
+        "elements": "dict",
+        # No defaults: the module level values are the defaults
+        "options": {
+            "description": {"type": "str"},
+            "disk_storage": {"type": "dict"},
+            "disk_storage_overrides": {"type": "dict"},
+            "guest_customization": {"type": "dict"},
+            "hardware_customization": {"type": "dict"},
+            "name": {"required": True, "type": "str"},
+            "placement": {"type": "dict"},
+            "powered_on": {"type": "bool"},
+            "vm_home_storage": {"type": "dict"},
+        },
+        "type": "list",
+    }
     argument_spec["template_library_item"] = {"type": "str"}
     argument_spec["vm_home_storage"] = {"type": "dict"}
+    argument_spec["wait_for_task"] = {"default": True, "type": "bool"}
 
     return argument_spec
 
@@ -458,6 +557,13 @@ def build_url(params):
 
 
 async def entry_point(module, session):
+    if module.params["targets"]:
+        if module.params["state"] != "deploy":
+            raise EmbeddedModuleFailure("targets is only supported with state=deploy")
+        return await run_provisioning_batch(
+            module.params, session, _deploy, module.params["targets"]
+        )
+
     if module.params["state"] == "present":
         if "_create" in globals():
             operation = "create"
@@ -561,6 +667,16 @@ async def _deploy(params, session):
         # aa
         "/api/vcenter/vm-template/library-items/{template_library_item}?action=deploy"
     ).format(**params) + gen_args(params, _in_query_parameters)
+    if params["run_as_task"]:
+        # The result of the task is the ID of the new VM
+        return await run_as_task(
+            params,
+            session,
+            _url,
+            payload,
+            "deploy",
+            fetch_url="https://{vcenter_hostname}/api/vcenter/vm".format(**params),
+        )
     async with session.post(_url, json=payload, **session_timeout(params)) as resp:
         try:
             if resp.headers["Content-Type"] == "application/json":
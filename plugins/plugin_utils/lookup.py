@@ -8,6 +8,12 @@ __metaclass__ = type
 
 
 import asyncio
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import time
 import urllib
 
 from ansible.errors import AnsibleLookupError
@@ -18,6 +24,7 @@ from ansible_collections.cloud.common.plugins.module_utils.turbo.exceptions impo
 from ansible_collections.vmware.vmware_rest.plugins.module_utils.vmware_rest import (
     gen_args,
     open_session,
+    read_json,
 )
 
 INVENTORY = {
@@ -112,13 +119,477 @@ INVENTORY = {
 }
 
 
+class PathIndex:
+    """A trie of the inventory paths of a datacenter.
+
+    Each node is a component of a path, below the datacenter, and holds
+    the objects found at this path as ``[MoID, object type]`` pairs. A path
+    resolves in as many steps as it has components. The index only holds
+    lists and dicts, ``to_dict()`` and ``from_dict()`` (de)serialize it.
+    """
+
+    VERSION = 1
+
+    def __init__(self, root=None):
+        self.root = root or {"objects": [], "children": {}}
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        index = cls()
+
+        def walk(moid, node, path):
+            for child in snapshot.child_nodes(moid):
+                if child in path:
+                    continue
+                name = snapshot.objects[child]["name"]
+                child_node = node["children"].setdefault(
+                    name, {"objects": [], "children": {}}
+                )
+                entry = [child, snapshot.objects[child]["type"]]
+                if entry not in child_node["objects"]:
+                    child_node["objects"].append(entry)
+                walk(child, child_node, path + [child])
+
+        walk(snapshot.datacenter, index.root, [snapshot.datacenter])
+        return index
+
+    def node(self, path):
+        node = self.root
+        for name in path:
+            node = node["children"].get(urllib.parse.unquote(name))
+            if node is None:
+                return None
+        return node
+
+    def find(self, path, object_type=None):
+        """Return the objects at the path, as (MoID, object type)."""
+        node = self.node(path)
+        if node is None:
+            return []
+        return [
+            (moid, _type)
+            for moid, _type in node["objects"]
+            if object_type is None or _type == object_type
+        ]
+
+    def children(self, path, object_type=None):
+        """Return the objects just below the path, as (name, MoID, object type)."""
+        node = self.node(path)
+        if node is None:
+            return []
+        return [
+            (name, moid, _type)
+            for name, child in node["children"].items()
+            for moid, _type in child["objects"]
+            if object_type is None or _type == object_type
+        ]
+
+    def to_dict(self):
+        return {"version": self.VERSION, "root": self.root}
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict) or data.get("version") != cls.VERSION:
+            raise ValueError("Unsupported path index format")
+        return cls(data["root"])
+
+
+# The objects that hold other objects in the snapshot, for each folder type
+FOLDER_CONTENT = {
+    "DATACENTER": ["datacenter"],
+    "DATASTORE": ["datastore"],
+    "HOST": ["cluster", "host"],
+    "NETWORK": ["network"],
+}
+
+
+class InventorySnapshot:
+    """The inventory of a datacenter, fetched once and shared by the lookups.
+
+    The folders, clusters, hosts, resource pools, datastores and networks of
+    the datacenter are listed concurrently, then the content of each
+    container is listed to build the tree. The REST API does not return the
+    parent of an object, hence one list call per container, but they are
+    all done in parallel and only once for all the lookups of the
+    ``VMWARE_INVENTORY_SNAPSHOT_TTL`` seconds (default 300). The VMs are not
+    part of the snapshot, they are fetched when needed with a filter on
+    their parent.
+
+    The snapshot of ``ROOT`` holds the datacenters and their folders, it
+    resolves the datacenter of the paths.
+
+    Once expired, the snapshot is refreshed: the objects are listed again
+    but only the containers that may hold a new object are listed. The
+    objects moved from a container to another are only seen by a full
+    build, done every ``VMWARE_INVENTORY_SNAPSHOT_MAX_AGE`` seconds (default
+    86400). With an InventoryStore, the snapshots are also kept on disk
+    for the next runs.
+    """
+
+    ROOT = ""
+
+    _snapshots = {}
+
+    def __init__(self, datacenter):
+        self.datacenter = datacenter
+        self.built_at = self.refreshed_at = time.time()
+        # MoID -> {"name": ..., "type": ...}
+        self.objects = {
+            datacenter: {"name": "", "type": "datacenter" if datacenter else "root"}
+        }
+        # MoID -> MoIDs of the objects directly inside
+        self.children = {}
+        # The paths of the objects, compiled once the tree is built
+        self.index = None
+
+    @classmethod
+    async def get(cls, lookup, datacenter):
+        """Return the snapshot of the datacenter, build it if needed."""
+        # The inventory depends on the permissions of the user
+        key = (
+            lookup._options["vcenter_hostname"],
+            lookup._options["vcenter_username"],
+            datacenter,
+        )
+        entry = cls._snapshots.get(key)
+        if entry is None or (entry.done() and entry.exception()):
+            entry = asyncio.ensure_future(cls._update(lookup, datacenter))
+        elif entry.done() and entry.result().expired():
+            entry = asyncio.ensure_future(
+                cls._update(lookup, datacenter, entry.result())
+            )
+        # The concurrent lookups wait for the same snapshot
+        cls._snapshots[key] = entry
+        return await asyncio.shield(entry)
+
+    @classmethod
+    async def _update(cls, lookup, datacenter, previous=None):
+        store = InventoryStore.from_options(lookup._options)
+        if previous is None and store:
+            previous = store.read(datacenter)
+            if previous and not previous.expired():
+                return previous
+        max_age = float(os.environ.get("VMWARE_INVENTORY_SNAPSHOT_MAX_AGE", 86400))
+        if previous and time.time() - previous.built_at > max_age:
+            previous = None
+        snapshot = await cls(datacenter).build(lookup, previous)
+        if store:
+            store.write(snapshot)
+        return snapshot
+
+    def expired(self):
+        ttl = float(os.environ.get("VMWARE_INVENTORY_SNAPSHOT_TTL", 300))
+        return time.time() - self.refreshed_at > ttl
+
+    def add(self, parent, moid):
+        if moid in self.objects and moid not in self.children.setdefault(parent, []):
+            self.children[parent].append(moid)
+
+    def _requests(self, moid):
+        # The list calls that return the content of a container, as
+        # (parent MoID, object type, filters)
+        obj = self.objects[moid]
+        if obj["type"] == "folder":
+            return [(moid, "folder", {"parent_folders": moid})] + [
+                (moid, i, {"folders": moid})
+                for i in FOLDER_CONTENT.get(obj["folder_type"], [])
+            ]
+        if obj["type"] == "cluster":
+            return [
+                (moid, "host", {"clusters": moid}),
+                (moid, "resource_pool", {"clusters": moid}),
+            ]
+        if obj["type"] == "resource_pool":
+            return [(moid, "resource_pool", {"parent_resource_pools": moid})]
+        if obj["type"] == "host":
+            return [(moid, "resource_pool", {"hosts": moid})]
+        return []
+
+    async def _list_children(self, lookup, containers):
+        requests = [i for moid in containers for i in self._requests(moid)]
+        for moid in containers:
+            self.children[moid] = []
+        results = await asyncio.gather(
+            *[
+                lookup._fetch_list(object_type, dict(filters))
+                for _, object_type, filters in requests
+            ]
+        )
+        for (parent, object_type, _), items in zip(requests, results):
+            for item in items:
+                self.add(parent, item[object_type])
+
+    def _containers_to_refresh(self, previous):
+        # The new containers, and the ones that may hold a new object
+        added = [i for i in self.objects if i not in previous.objects]
+        added_types = set(self.objects[i]["type"] for i in added)
+        refresh = set(added)
+        for moid in self.objects:
+            if any(_type in added_types for _, _type, _ in self._requests(moid)):
+                refresh.add(moid)
+        return refresh
+
+    async def build(self, lookup, previous=None):
+        """Build the tree, or refresh the tree of the ``previous`` snapshot."""
+        if self.datacenter == self.ROOT:
+            requests = [("folder", {"type": "DATACENTER"}), ("datacenter", {})]
+        else:
+            dc_filter = {"datacenters": self.datacenter}
+            requests = [
+                (i, dict(dc_filter))
+                for i in (
+                    "folder",
+                    "cluster",
+                    "host",
+                    "resource_pool",
+                    "datastore",
+                    "network",
+                )
+            ]
+        lists = await asyncio.gather(
+            *[lookup._fetch_list(i, filters) for i, filters in requests]
+        )
+        for (object_type, _), items in zip(requests, lists):
+            for item in items:
+                self.objects[item[object_type]] = {
+                    "name": item["name"],
+                    "type": object_type,
+                    "folder_type": item.get("type"),
+                }
+
+        if previous is None:
+            refresh = set(self.objects)
+        else:
+            # Keep the content of the containers, without the objects that
+            # have been removed
+            self.built_at = previous.built_at
+            self.children = {
+                parent: [i for i in children if i in self.objects]
+                for parent, children in previous.children.items()
+                if parent in self.objects
+            }
+            refresh = self._containers_to_refresh(previous)
+
+        await self._list_children(
+            lookup,
+            [
+                i
+                for i in refresh
+                if self.objects[i]["type"] in ("folder", "cluster", "resource_pool")
+            ],
+        )
+
+        # The hosts of a cluster are only listed under the cluster
+        clustered = {
+            i
+            for moid, obj in self.objects.items()
+            if obj["type"] == "cluster"
+            for i in self.children.get(moid, [])
+            if self.objects[i]["type"] == "host"
+        }
+        for moid, obj in self.objects.items():
+            if obj["type"] == "folder":
+                self.children[moid] = [
+                    i for i in self.children.get(moid, []) if i not in clustered
+                ]
+
+        # The resource pools of a standalone host
+        await self._list_children(
+            lookup,
+            [
+                i
+                for i in refresh
+                if self.objects[i]["type"] == "host" and i not in clustered
+            ],
+        )
+
+        # Only keep the root resource pool under a cluster or a host, the
+        # other ones are below their parent resource pool
+        nested = {
+            i
+            for moid, obj in self.objects.items()
+            if obj["type"] == "resource_pool"
+            for i in self.children.get(moid, [])
+        }
+        for moid, obj in self.objects.items():
+            if obj["type"] in ("cluster", "host"):
+                self.children[moid] = [
+                    i for i in self.children.get(moid, []) if i not in nested
+                ]
+
+        # The top level folders (vm, host, datastore, network) belong to the
+        # datacenter, the datacenters and folders outside of a folder to the
+        # root
+        in_folder = {
+            i
+            for moid, obj in self.objects.items()
+            if obj["type"] == "folder"
+            for i in self.children.get(moid, [])
+        }
+        self.children[self.datacenter] = []
+        for moid, obj in self.objects.items():
+            if moid != self.datacenter and moid not in in_folder:
+                if obj["type"] == "folder" or self.datacenter == self.ROOT:
+                    self.add(self.datacenter, moid)
+
+        self.index = PathIndex.from_snapshot(self)
+        return self
+
+    def child_nodes(self, moid):
+        children = list(self.children.get(moid, []))
+        if self.objects[moid]["type"] in ("cluster", "host"):
+            # The resource pools can be reached with or without the name of
+            # the root resource pool (Resources)
+            for i in list(children):
+                if self.objects[i]["type"] == "resource_pool":
+                    children += self.children.get(i, [])
+        if moid == self.ROOT:
+            # The datacenters can be reached with or without the name of the
+            # root folder (Datacenters), if the vCenter lists it
+            for i in list(children):
+                if self.objects[i]["type"] == "folder":
+                    children += self.children.get(i, [])
+        return children
+
+    def to_dict(self):
+        return {
+            "datacenter": self.datacenter,
+            "built_at": self.built_at,
+            "refreshed_at": self.refreshed_at,
+            "objects": self.objects,
+            "children": self.children,
+            "index": self.index.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        snapshot = cls(data["datacenter"])
+        snapshot.built_at = data["built_at"]
+        snapshot.refreshed_at = data["refreshed_at"]
+        snapshot.objects = data["objects"]
+        snapshot.children = data["children"]
+        snapshot.index = PathIndex.from_dict(data["index"])
+        return snapshot
+
+
+class InventoryStore:
+    """Keep the inventory snapshots on disk, between the runs.
+
+    There is one JSON file per vCenter and user, with the snapshot of each
+    datacenter, in a directory that must not be accessible to the other
+    users.
+    """
+
+    VERSION = 1
+
+    def __init__(self, directory, vcenter_hostname, vcenter_username):
+        self.directory = directory
+        digest = hashlib.sha256(
+            f"{vcenter_hostname}\0{vcenter_username}".encode()
+        ).hexdigest()
+        self.path = os.path.join(directory, f"inventory-{digest}.json")
+
+    @classmethod
+    def from_options(cls, options):
+        directory = options.get("vcenter_inventory_cache")
+        if not directory:
+            return None
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        st = os.stat(directory)
+        if st.st_uid != os.getuid() or st.st_mode & 0o077:
+            # Someone else could change the MoIDs we return
+            return None
+        return cls(directory, options["vcenter_hostname"], options["vcenter_username"])
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as fd:
+                data = json.load(fd)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get("version") != self.VERSION:
+            return {}
+        return data.get("datacenters") or {}
+
+    def read(self, datacenter):
+        try:
+            return InventorySnapshot.from_dict(self._load()[datacenter])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def write(self, snapshot):
+        datacenters = self._load()
+        datacenters[snapshot.datacenter] = snapshot.to_dict()
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": self.VERSION, "datacenters": datacenters}, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            os.unlink(tmp_path)
+
+
+class MoidCache:
+    """The MoIDs found by the lookups, shared by all of them.
+
+    The lookups run in the turbo daemon, the cache is kept in the process.
+    The entries are keyed by (vCenter, path prefix, object type): the
+    datacenters, the folder chains and the clusters resolved for a path are
+    reused by the next lookups of the paths with the same prefix. Only the
+    objects that have been found are kept, for ``VMWARE_LOOKUP_CACHE_TTL``
+    seconds, and at most ``VMWARE_LOOKUP_CACHE_SIZE`` entries (default
+    4096). The cache is disabled by default (TTL 0): an object that is
+    deleted and created again within the TTL would resolve to its old MoID.
+    """
+
+    _cache = None
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()
+
+    @classmethod
+    def get_cache(cls):
+        if cls._cache is None:
+            cls._cache = cls(
+                ttl=float(os.environ.get("VMWARE_LOOKUP_CACHE_TTL", 0)),
+                max_size=int(os.environ.get("VMWARE_LOOKUP_CACHE_SIZE", 4096)),
+            )
+        return cls._cache
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key, value):
+        if self.ttl <= 0 or not value:
+            return
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
 class Lookup:
+    # (vCenter, datacenter or cluster MoID) -> the MoIDs of its roots, see
+    # _path_roots()
+    _roots = {}
+
     def __init__(self, options):
         self._options = options
+        # The levels fetched by recursive_folder_or_rp_moid_search()
+        self._levels = {}
 
     @classmethod
     async def entry_point(cls, terms, options):
-        if not terms or not terms[0]:
+        if not terms or not all(terms):
             raise AnsibleLookupError(
                 "Option _terms is required but no object has been specified"
             )
@@ -131,6 +602,12 @@ class Lookup:
                 vcenter_password=options["vcenter_password"],
                 validate_certs=options.get("vcenter_validate_certs"),
                 log_file=options.get("vcenter_rest_log_file"),
+                connection_limit=options.get("vcenter_connection_limit"),
+                connection_limit_per_host=options.get(
+                    "vcenter_connection_limit_per_host"
+                ),
+                keepalive_timeout=options.get("vcenter_keepalive_timeout"),
+                dns_cache_ttl=options.get("vcenter_dns_cache_ttl"),
             )
         except EmbeddedModuleFailure as e:
             raise AnsibleLookupError(
@@ -140,14 +617,83 @@ class Lookup:
         lookup = cls(options)
         lookup._options["session"] = session
 
-        task = asyncio.ensure_future(lookup.moid(terms[0]))
+        task = asyncio.ensure_future(lookup.moids(terms))
 
         return await task
 
+    async def moids(self, terms):
+        """Return the MoIDs of all the paths, in the same order.
+
+        Each path is resolved with its own Lookup, but the paths that share
+        a parent are grouped: the prefix of the group is resolved once, then
+        the VMs, datastores and networks of the same folder are listed with
+        a single call. The paths that cannot be resolved that way go through
+        moid(), which reuses the prefixes kept in MoidCache.
+        """
+        unique = list(dict.fromkeys(terms))
+        groups = {}
+        for term in unique:
+            groups.setdefault(self._parent_path(term), []).append(term)
+
+        results = {}
+        for parent, group in groups.items():
+            if (
+                len(group) > 1
+                and self._options["object_type"] in ("vm", "datastore", "network")
+                and parent.strip("/")
+            ):
+                results.update(await self._batch_moids(parent, group))
+
+        async def resolve(term):
+            results[term] = await type(self)(dict(self._options)).moid(term)
+
+        pending = [term for term in unique if term not in results]
+        # Resolve one path per parent first, the others reuse its prefix.
+        # The very first one also resolves the datacenter for all of them.
+        first = {}
+        for term in pending:
+            first.setdefault(self._parent_path(term), term)
+        first = list(first.values())
+        if first:
+            await resolve(first[0])
+        await asyncio.gather(*[resolve(term) for term in first[1:]])
+        await asyncio.gather(
+            *[resolve(term) for term in pending if term not in results]
+        )
+        return [results[term] for term in terms]
+
+    @staticmethod
+    def _parent_path(term):
+        return term.rstrip("/").rpartition("/")[0]
+
+    async def _batch_moids(self, parent, terms):
+        # The leaves are looked up in the parent folder, with one call for
+        # all of them. What does not match a single object is left to moid().
+        object_type = self._options["object_type"]
+        folder_lookup = type(self)(dict(self._options, object_type="folder"))
+        folder_moid = await folder_lookup.moid(parent)
+        if not folder_moid:
+            return {}
+
+        leaves = {term: term.rpartition("/")[2] for term in terms if term[-1] != "/"}
+        names = list(dict.fromkeys(leaves.values()))
+        found = {}
+        for i in range(0, len(names), 100):
+            filters = {"folders": folder_moid, "names": names[i : i + 100]}
+            for item in await self._fetch_list(object_type, filters):
+                if "%2f" not in item["name"]:
+                    found.setdefault(item["name"], []).append(item[object_type])
+
+        results = {}
+        for term, name in leaves.items():
+            moids = found.get(urllib.parse.unquote(name), [])
+            if len(moids) == 1:
+                results[term] = moids[0]
+        return results
+
     async def fetch(self, url):
         async with self._options["session"].get(url) as response:
-            result = await response.json()
-            return result
+            return await read_json(response)
 
     def build_url(self, object_type, params):
         try:
@@ -167,6 +713,14 @@ class Lookup:
         _url = self.build_url(object_type, filters)
         return await self.fetch(_url)
 
+    async def _fetch_list(self, object_type, filters):
+        result = await self._helper_fetch(object_type, filters)
+        if not isinstance(result, list):
+            raise AnsibleLookupError(
+                f"Unable to list the {object_type} objects: {to_native(result)}"
+            )
+        return result
+
     @staticmethod
     def ensure_result(result, object_type, object_name=None):
         object_name_decoded = None
@@ -421,8 +975,24 @@ class Lookup:
 
     async def _get_cluster_moid(self, object_path, filters):
         cluster_moid = ""
+        key = None
+        if (
+            object_path
+            and filters.get("names") == object_path[0]
+            and filters.get("folders")
+            and filters["folders"] == self._options.get("_folder_moid")
+        ):
+            key = self._cache_key(
+                self._options["_folder_path"] + (object_path[0],), "cluster"
+            )
+            cluster_moid = MoidCache.get_cache().get(key)
+            if cluster_moid:
+                return cluster_moid, object_path[1:]
+
         result = await self._helper_fetch("cluster", filters)
         cluster_moid = self.ensure_result(result, "cluster", filters["names"])
+        if key:
+            MoidCache.get_cache().set(key, cluster_moid)
 
         return cluster_moid, object_path[1:]
 
@@ -439,86 +1009,210 @@ class Lookup:
 
         return await self._helper_fetch(object_type, filters)
 
+    async def _path_roots(self, object_type, filters):
+        """Return the MoIDs a folder or a resource pool path starts from.
+
+        These are the top level folders (vm, host, datastore and network) of
+        the datacenter, or the root resource pool of the cluster. They never
+        change for a given datacenter or cluster, they are kept for the life
+        of the process. Returns None if the path is not below one of them.
+        """
+        if object_type == "folder" and filters.get("datacenters"):
+            kind, moid = "datacenter", filters["datacenters"]
+            keys = ("vm_folder", "host_folder", "datastore_folder", "network_folder")
+        elif object_type == "resource_pool" and filters.get("clusters"):
+            kind, moid = "cluster", filters["clusters"]
+            keys = ("resource_pool",)
+        else:
+            return None
+        key = (self._options["vcenter_hostname"], moid)
+        if key not in self._roots:
+            info = await self.fetch(
+                f"https://{self._options['vcenter_hostname']}/api/vcenter/{kind}/{moid}"
+            )
+            if isinstance(info, dict) and isinstance(info.get("value"), dict):
+                info = info["value"]  # 7.0.2 <
+            roots = [info[k] for k in keys if isinstance(info, dict) and info.get(k)]
+            if not roots:
+                return []
+            self._roots[key] = roots
+        return self._roots[key]
+
+    async def _fetch_level(self, object_type, filters):
+        url = self.build_url(object_type, filters)
+        if url not in self._levels:
+            self._levels[url] = await self.fetch(url)
+        candidates = self._levels[url]
+        return candidates if isinstance(candidates, list) else []
+
     async def recursive_folder_or_rp_moid_search(
-        self,
-        object_path,
-        object_type,
-        filters,
-        parent_object=None,
-        objects_moid=None,
-        result=None,
+        self, object_path, object_type, filters
     ):
-        if result is None:
-            # GET MoID of all the objects specified in the path
-            result = []
-            objects_moid = await self.get_all_objects_path_moid(
-                object_path, object_type, filters
-            )
-            if not objects_moid:
-                return ""
-            elif len(objects_moid) == 1:
-                return objects_moid
-
-            return await self.recursive_folder_or_rp_moid_search(
-                object_path,
-                object_type,
-                filters,
-                objects_moid=objects_moid,
-                result=result,
-            )
+        # GET MoID of all the objects specified in the path
+        objects_moid = await self.get_all_objects_path_moid(
+            object_path, object_type, filters
+        )
+        if not objects_moid:
+            return ""
+        roots = await self._path_roots(object_type, filters)
+        if len(objects_moid) == 1 and (
+            roots is None or objects_moid[0][object_type] in roots
+        ):
+            return objects_moid
+
+        # Walk the path breadth-first: the candidates of a level are the
+        # objects with the name of the level inside the object found at the
+        # previous level, the first level is anchored at the roots.
+        known_names = set(i["name"] for i in objects_moid)
         parent_key = f"parent_{object_type}s"
-        filters[parent_key] = ""
+        result = []
+        for depth, name in enumerate(object_path):
+            if name not in known_names:
+                break
+            level_filters = dict(filters)
+            level_filters["names"] = name
+            if result:
+                level_filters[parent_key] = result[-1][object_type]
+            candidates = await self._fetch_level(object_type, level_filters)
+            if depth == 0 and roots is not None:
+                # The same name may be used deeper in the tree
+                anchored = [i for i in candidates if i[object_type] in roots]
+                if not anchored and object_type == "resource_pool" and roots:
+                    # The root resource pool (Resources) may be left out
+                    level_filters[parent_key] = roots
+                    anchored = await self._fetch_level(object_type, level_filters)
+                if not anchored:
+                    return ""
+                candidates = anchored
+            if not candidates:
+                break
+            if len(candidates) > 1:
+                # The object of this level cannot be told apart
+                return ""
+            result.append(candidates[0])
 
-        if objects_moid and object_path and objects_moid[0]["name"] == object_path[0]:
-            # There exists a folder MoID with this name
-            filters["names"] = object_path[0]
+        # Return result and what left in the path
+        return result or objects_moid
 
-            if parent_object is not None:
-                filters[parent_key] = parent_object
-                tasks = [
-                    asyncio.ensure_future(self._helper_fetch(object_type, filters))
-                    for parent_object_info in objects_moid
-                    if parent_object_info["name"] == object_path[0]
-                ]
-                _result = [await i for i in tasks]
-                [
-                    result.append(elem[0])
-                    for elem in _result
-                    if elem
-                    if _result and elem[0] not in result
-                ]
-            else:
-                _result = await self._helper_fetch(object_type, filters)
-                if not _result:
-                    return ""
-                [result.append(elem) for elem in _result if elem not in result]
-                # Update parent_object
-                parent_object = result[0][object_type]
-                return await self.recursive_folder_or_rp_moid_search(
-                    object_path[1:],
-                    object_type,
-                    filters,
-                    parent_object,
-                    objects_moid[1:],
-                    result,
-                )
-        if not object_path or (objects_moid and len(objects_moid) == 0):
-            # Return result and what left in the path
-            if not result:
-                result = objects_moid
-            return result
+    async def _snapshot_moid(self, object_path):
+        object_type = self._options["object_type"]
+        look_inside = self._options["_terms"][-1] == "/"
+        if not object_path and not look_inside:
+            return ""
+        snapshot = await InventorySnapshot.get(self, self._options["dc_moid"])
+        index = snapshot.index
 
-        if result:
-            # Update parent_object
-            parent_object = result[-1][object_type]
-        return await self.recursive_folder_or_rp_moid_search(
-            object_path[1:],
-            object_type,
-            filters,
-            parent_object,
-            objects_moid[1:],
-            result,
-        )
+        if object_type == "vm":
+            # The VMs are not in the snapshot, list them with a filter on
+            # their parent
+            parents = index.find(object_path if look_inside else object_path[:-1])
+            filter_keys = {
+                "cluster": "clusters",
+                "folder": "folders",
+                "host": "hosts",
+                "resource_pool": "resource_pools",
+            }
+            by_filter = {}
+            for moid, parent_type in parents:
+                key = filter_keys.get(parent_type)
+                if key:
+                    by_filter.setdefault(key, []).append(moid)
+            result = []
+            for key, moids in by_filter.items():
+                filters = self._init_filter()
+                filters[key] = moids
+                if not look_inside:
+                    filters["names"] = object_path[-1]
+                for vm in await self._fetch_list("vm", filters):
+                    if vm not in result:
+                        result.append(vm)
+            return self.ensure_result(result, "vm")
+
+        if look_inside:
+            objects = index.children(object_path, object_type)
+        else:
+            name = urllib.parse.unquote(object_path[-1])
+            objects = [
+                (name, moid, t) for moid, t in index.find(object_path, object_type)
+            ]
+        result = []
+        for name, moid, _type in objects:
+            if {"name": name, object_type: moid} not in result:
+                result.append({"name": name, object_type: moid})
+        return self.ensure_result(result, object_type)
+
+    async def _snapshot_datacenter_moid(self, path):
+        # The shortest prefix of the path that ends with a datacenter
+        snapshot = await InventorySnapshot.get(self, InventorySnapshot.ROOT)
+        for i in range(1, len(path) + 1):
+            datacenters = snapshot.index.find(path[:i], "datacenter")
+            if len(datacenters) == 1:
+                return datacenters[0][0], path[i - 1 :]
+            if datacenters:
+                return "", ()
+        return "", ()
+
+    def _cache_key(self, path, object_type):
+        return (self._options["vcenter_hostname"], tuple(path), object_type)
+
+    def _folder_type(self):
+        # The folder type used by get_all_objects_path_moid()
+        if self._options["object_type"] == "vm":
+            return "VIRTUAL_MACHINE"
+        if self._options["object_type"] in ("resource_pool", "cluster", "folder"):
+            return ""
+        return self._options["object_type"].upper()
+
+    async def _cached_datacenter_moid(self, path):
+        cache = MoidCache.get_cache()
+        for i in range(1, len(path) + 1):
+            dc_moid = cache.get(self._cache_key(path[:i], "datacenter"))
+            if dc_moid:
+                return dc_moid, path[i - 1 :]
+
+        dc_moid, _path = await self._get_datacenter_moid(path)
+        _path = tuple(_path)
+        if dc_moid and _path:
+            consumed = len(path) - len(_path) + 1
+            cache.set(self._cache_key(path[:consumed], "datacenter"), dc_moid)
+        return dc_moid, _path
+
+    async def _cached_folder_moid(self, prefix, object_path, filters):
+        cache = MoidCache.get_cache()
+        object_path = tuple(object_path)
+        folder_key = "folder:" + self._folder_type()
+        look_inside = self._options["_terms"][-1] == "/"
+
+        if self._options["object_type"] != "folder":
+            # Start from the longest folder chain already known, as long as
+            # the rest of the path is not in a sub-folder of it
+            for i in range(len(object_path) - 1, 0, -1):
+                entry = cache.get(self._cache_key(prefix + object_path[:i], folder_key))
+                if not entry:
+                    continue
+                rest = object_path[i:]
+                if rest[0] in entry["subfolders"]:
+                    break
+                if len(rest) > 1 and not cache.get(
+                    self._cache_key(prefix + object_path[: i + 1], "cluster")
+                ):
+                    break
+                return entry["moid"], rest
+
+        folder_moid, _path = await self._get_folder_moid(object_path, filters)
+        if self._options["object_type"] == "folder":
+            consumed = object_path
+        else:
+            consumed = object_path[: len(object_path) - len(_path)]
+        if folder_moid and consumed and not look_inside and cache.ttl > 0:
+            subfolders = await self._fetch_list(
+                "folder", {"parent_folders": folder_moid}
+            )
+            cache.set(
+                self._cache_key(prefix + consumed, folder_key),
+                {"moid": folder_moid, "subfolders": [i["name"] for i in subfolders]},
+            )
+        return folder_moid, _path
 
     async def moid(self, object_path):
         folder_moid = ""
@@ -534,21 +1228,40 @@ class Lookup:
         object_type = self._options["object_type"]
         path = tuple(filter(None, object_path.split("/")))
 
+        cache = MoidCache.get_cache()
+        result = cache.get(self._cache_key([object_path], object_type))
+        if result:
+            return result
+
         # Retrieve datacenter MoID
-        dc_moid, _path = await self._get_datacenter_moid(path)
+        if self._options.get("vcenter_inventory_snapshot"):
+            dc_moid, _path = await self._snapshot_datacenter_moid(path)
+        else:
+            dc_moid, _path = await self._cached_datacenter_moid(path)
         if object_type == "datacenter" or not dc_moid:
             return dc_moid
         self._options["dc_moid"] = dc_moid
         filters["datacenters"] = self._options["dc_moid"]
 
+        # The part of the path already resolved
+        prefix = path[: len(path) - len(_path) + 1]
         if _path:
             _path = _path[1:]
 
+        if self._options.get("vcenter_inventory_snapshot"):
+            return await self._snapshot_moid(_path)
+
         # Retrieve folders MoID
-        folder_moid, _path = await self._get_folder_moid(_path, filters)
+        remaining = _path
+        folder_moid, _path = await self._cached_folder_moid(prefix, _path, filters)
         if object_type == "folder" or not folder_moid:
+            cache.set(self._cache_key([object_path], object_type), folder_moid)
             return folder_moid
         filters["folders"] = folder_moid
+        self._options["_folder_moid"] = folder_moid
+        self._options["_folder_path"] = (
+            prefix + remaining[: len(remaining) - len(_path)]
+        )
 
         if object_type == "cluster":
             if object_path[-1] != "/":
@@ -574,4 +1287,5 @@ class Lookup:
         if object_type == "host":
             result, _obj_path = await self._get_host_moid(_path, filters)
 
+        cache.set(self._cache_key([object_path], object_type), result)
         return result
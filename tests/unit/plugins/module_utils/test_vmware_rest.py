@@ -0,0 +1,1312 @@
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import asyncio
+import json
+import os
+import time
+import types
+import urllib
+
+import aiohttp
+import pytest
+from ansible_collections.cloud.common.plugins.module_utils.turbo.exceptions import (
+    EmbeddedModuleFailure,
+)
+from ansible_collections.vmware.vmware_rest.plugins.module_utils.vmware_rest import (
+    AdaptiveLimiter,
+    CachedResponse,
+    JsonListStream,
+    PerfCollector,
+    RequestLogger,
+    RetryPolicy,
+    SessionPool,
+    SessionTokenCache,
+    TaskPoller,
+    VmwareRestSession,
+    _DocumentCache,
+    _perf_collector,
+    build_full_device_list,
+    connection_limit,
+    connector_settings,
+    defer_record,
+    endpoint_template,
+    exists,
+    find_vm,
+    get_vm_document,
+    merge_update,
+    perf_trace_config,
+    read_json,
+    read_json_with_details,
+    request_log_trace_config,
+    run_as_task,
+    run_device_batch,
+    run_provisioning_batch,
+    run_vm_bulk_action,
+    update_changed_flag,
+    vm_document_info,
+    vm_scope,
+)
+
+
+class FakeContent:
+    """The ``content`` stream of a response, served in fixed size chunks."""
+
+    def __init__(self, body, chunk_size, on_eof=None):
+        self.chunks = [
+            body[i : i + chunk_size] for i in range(0, len(body), chunk_size)
+        ]
+        self.reads = 0
+        # Like aiohttp, the connection is released once the body is read
+        self.on_eof = on_eof
+
+    def at_eof(self):
+        return False
+
+    async def read(self, n=-1):
+        self.reads += 1
+        if n < 0:
+            data = b"".join(self.chunks)
+            self.chunks = []
+        else:
+            data = self.chunks.pop(0) if self.chunks else b""
+        if not self.chunks and self.on_eof:
+            self.on_eof()
+            self.on_eof = None
+        return data
+
+
+class FakeResponse:
+    url = "https://vcenter/api/vcenter/vm"
+
+    def __init__(self, body, chunk_size=1, on_eof=None):
+        self.content = FakeContent(body, chunk_size, on_eof)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+BODIES = [
+    b"[]",
+    b" [ ]\n",
+    b"[1, 22, 333, -4.5e10, 0.125]",
+    b'["vm-1", "a \\"quoted\\" ] , [", "\\u00e9t\\u00e9", "caf\xc3\xa9 \xe2\x82\xac"]',
+    b'[{"vm": "vm-1", "name": "web", "nested": {"a": [1, {"b": null}]}}, true, false, null]',
+    b'{"value": ["vm-1", "vm-2"]}',
+    b'{"error_type": "NOT_FOUND", "messages": []}',
+    b'"a string"',
+]
+
+
+@pytest.mark.parametrize("body", BODIES)
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 1024])
+def test_read_json_across_chunks(body, chunk_size):
+    assert run(read_json(FakeResponse(body, chunk_size))) == json.loads(body)
+
+
+def test_read_json_empty_body():
+    assert run(read_json(FakeResponse(b""))) is None
+
+
+def test_read_json_cached_response():
+    body = b'[{"vm": "vm-1"}]'
+    assert run(read_json(CachedResponse(200, {}, body))) == [{"vm": "vm-1"}]
+
+
+def test_number_split_at_the_end_of_a_chunk():
+    # "12" then "34": 12 must not be yielded before the next chunk
+    resp = FakeResponse(b"[12", chunk_size=3)
+    resp.content.chunks.append(b"34]")
+    assert run(read_json(resp)) == [1234]
+
+
+def test_document_that_is_not_a_list():
+    async def consume():
+        stream = JsonListStream(FakeResponse(b'{"value": [1, 2]}', 4))
+        elements = [e async for e in stream]
+        return elements, stream.is_list, stream.document
+
+    assert run(consume()) == ([], False, {"value": [1, 2]})
+
+
+def test_elements_are_yielded_before_the_end_of_the_list():
+    async def first_element():
+        resp = FakeResponse(b'["vm-1", "vm-2", "vm-3", "vm-4"]', chunk_size=8)
+        async for element in JsonListStream(resp):
+            return element, resp.content.chunks
+
+    element, remaining = run(first_element())
+    assert element == "vm-1"
+    assert remaining
+
+
+@pytest.mark.parametrize("body", [b'[{"a": 1}, {"b":', b"[1, 2", b"[nope]"])
+def test_truncated_or_invalid_list(body):
+    with pytest.raises(EmbeddedModuleFailure):
+        run(read_json(FakeResponse(body, 3)))
+
+
+def test_trace_records_are_flushed_at_the_end_of_the_stream():
+    body = b'[{"vm": "vm-1"}, {"vm": "vm-2"}]  \n'
+    resp = FakeResponse(body, 5)
+    records = []
+    defer_record(resp, lambda body, size: records.append(size))
+    run(read_json(resp))
+    assert records == [len(body)]
+
+
+class FakeSession:
+    """Answer GET /api/vcenter/vm/{vm} and count the requests in flight.
+
+    With ``connection_limit``, a request waits for a free connection, like
+    with the limit of an aiohttp connector.
+    """
+
+    def __init__(self, connection_limit=0):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._connector = types.SimpleNamespace(
+            limit=connection_limit, limit_per_host=0
+        )
+        self._connections = None
+
+    def connections(self):
+        if self._connections is None and self._connector.limit:
+            self._connections = asyncio.Semaphore(self._connector.limit)
+        return self._connections
+
+    def get(self, url, **kwargs):
+        return FakeGet(self, url.rsplit("/", 1)[-1])
+
+
+class FakeGet:
+    def __init__(self, session, _id):
+        self.session = session
+        self._id = _id
+        self.status = 200
+
+    async def __aenter__(self):
+        if self.session.connections():
+            await self.session.connections().acquire()
+        self.session.in_flight += 1
+        self.session.max_in_flight = max(
+            self.session.max_in_flight, self.session.in_flight
+        )
+        await asyncio.sleep(0.001)
+        return self
+
+    async def __aexit__(self, *args):
+        self.session.in_flight -= 1
+        if self.session.connections():
+            self.session.connections().release()
+
+    async def json(self):
+        return {"name": self._id}
+
+
+def test_read_json_with_details():
+    ids = [f"vm-{i}" for i in range(20)]
+    session = FakeSession()
+    resp = FakeResponse(json.dumps(ids).encode(), chunk_size=16)
+    value = run(
+        read_json_with_details(
+            session, "https://vcenter/api/vcenter/vm", resp, concurrency=3
+        )
+    )
+    assert value == [{"name": i} for i in ids]
+    assert session.max_in_flight == 3
+
+
+def test_read_json_with_details_keeps_the_summaries():
+    summaries = [{"vm": "vm-1", "name": "web"}]
+    session = FakeSession()
+    resp = FakeResponse(json.dumps(summaries).encode(), chunk_size=4)
+    value = run(read_json_with_details(session, "https://vcenter/api/vcenter/vm", resp))
+    assert value == summaries
+    assert session.max_in_flight == 0
+
+
+def read_with_held_connection(session, ids, concurrency=None):
+    async def read():
+        # The list holds a connection until its body is read
+        await session.connections().acquire()
+        resp = FakeResponse(
+            json.dumps(ids).encode(),
+            chunk_size=16,
+            on_eof=session.connections().release,
+        )
+        return await asyncio.wait_for(
+            read_json_with_details(
+                session, "https://vcenter/api/vcenter/vm", resp, concurrency
+            ),
+            timeout=5,
+        )
+
+    return run(read())
+
+
+def test_read_json_with_details_with_a_single_connection():
+    ids = [f"vm-{i}" for i in range(50)]
+    session = FakeSession(connection_limit=1)
+    value = read_with_held_connection(session, ids)
+    assert value == [{"name": i} for i in ids]
+    assert session.max_in_flight == 1
+
+
+def test_read_json_with_details_leaves_a_connection_to_the_list():
+    ids = [f"vm-{i}" for i in range(50)]
+    session = FakeSession(connection_limit=4)
+    value = read_with_held_connection(session, ids, concurrency=20)
+    assert value == [{"name": i} for i in ids]
+    assert session.max_in_flight == 3
+
+
+class FakeRequest:
+    def __init__(self, response):
+        self.response = response
+
+    async def __aenter__(self):
+        return self.response
+
+    async def __aexit__(self, *args):
+        pass
+
+    def __await__(self):
+        return self.__aenter__().__await__()
+
+
+class FakeApi:
+    """A session that answers with ``handler(method, url, json)``.
+
+    The handler returns the status and the JSON document of the answer.
+    The requests are kept in ``requests``, and their session ID in
+    ``session_ids``. It can also stand for the aiohttp session of a
+    VmwareRestSession.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+        self.session_ids = []
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method, url, kwargs.get("json")))
+        headers = kwargs.get("headers") or {}
+        self.session_ids.append(headers.get("vmware-api-session-id"))
+        status, document = self.handler(method, url, kwargs.get("json"))
+        body = b"" if document is None else json.dumps(document).encode()
+        headers = {"Content-Type": "application/json"} if body else {}
+        return FakeRequest(CachedResponse(status, headers, body))
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+
+MODULE_PARAMS = {
+    "vcenter_hostname": "vcenter",
+    "vcenter_username": "user",
+    "vcenter_password": "pass",
+    "session_timeout": None,
+    "name": None,
+    "placement": None,
+    "source": "vm-1",
+}
+
+
+def provision(targets, vms=()):
+    """Run a clone batch, ``vms`` are the VMs already in the inventory."""
+    created = []
+
+    def handler(method, url, payload):
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+        return 200, [
+            vm
+            for vm in vms
+            if vm["name"] in query["names"]
+            and all(vm.get(k[:-1]) in query[k] for k in query if k != "names")
+        ]
+
+    async def clone(item, session):
+        created.append(item["name"])
+        return {"value": {"name": item["name"]}, "changed": True, "failed": False}
+
+    session = FakeApi(handler)
+    result = run(run_provisioning_batch(MODULE_PARAMS, session, clone, targets))
+    return result, created, session.requests
+
+
+def test_provisioning_batch_skips_the_existing_vms():
+    targets = [
+        {"name": "a", "placement": {"folder": "group-v1"}},
+        {"name": "b", "placement": {"folder": "group-v1"}},
+        {"name": "a", "placement": {"folder": "group-v2"}},
+    ]
+    vms = [{"vm": "vm-2", "name": "a", "folder": "group-v1"}]
+    result, created, requests = provision(targets, vms)
+    assert created == ["b", "a"]
+    assert result["value"][0]["id"] == "vm-2"
+    assert result["progress"] == {"total": 3, "created": 2, "existing": 1, "failed": 0}
+    # One list call per folder
+    assert len(requests) == 2
+
+
+def test_provisioning_batch_fails_when_the_name_is_ambiguous():
+    targets = [{"name": "a", "placement": {"host": "host-1"}}]
+    vms = [
+        {"vm": "vm-2", "name": "a", "host": "host-1"},
+        {"vm": "vm-3", "name": "a", "host": "host-1"},
+    ]
+    result, created, _ = provision(targets, vms)
+    assert created == []
+    assert result["failed"]
+    assert "vm-2, vm-3" in result["value"][0]["msg"]
+
+
+@pytest.mark.parametrize(
+    "targets,msg",
+    [
+        ([{"name": "a"}], "The target a needs a folder"),
+        (
+            [
+                {"name": "a", "placement": {"folder": "group-v1"}},
+                {"name": "a", "placement": {"folder": "group-v1"}},
+            ],
+            "Duplicate target: a",
+        ),
+        (
+            [
+                {"name": "a", "placement": {"folder": "group-v1"}},
+                {"name": "a", "placement": {"host": "host-1"}},
+            ],
+            "Duplicate target: a",
+        ),
+    ],
+)
+def test_provisioning_batch_rejects_the_targets(targets, msg):
+    with pytest.raises(EmbeddedModuleFailure, match=msg):
+        provision(targets)
+
+
+def log_requests(path, fmt, requests):
+    """Feed the trace config of a RequestLogger with (method, url, status, body)."""
+    logger = RequestLogger(str(path), flush_interval=0.01, fmt=fmt)
+    trace_config = request_log_trace_config(aiohttp, logger)
+    for method, url, status, body in requests:
+        ctx = types.SimpleNamespace()
+        params = types.SimpleNamespace(
+            method=method,
+            url=url,
+            headers={"vmware-api-session-id": "secret", "Accept": "*/*"},
+            response=CachedResponse(status, {}, body),
+            chunk=body,
+        )
+        run(trace_config.on_request_start[0](None, ctx, params))
+        run(trace_config.on_request_end[0](None, ctx, params))
+        run(trace_config.on_response_chunk_received[0](None, ctx, params))
+    logger.close()
+    return path.read_text()
+
+
+REQUESTS = [
+    ("POST", "https://vcenter/api/session", 201, b'"secret"'),
+    ("POST", "https://vcenter/rest/com/vmware/cis/session", 200, b'{"value":"secret"}'),
+    ("GET", "https://vcenter/api/vcenter/vm", 200, b"[]"),
+]
+
+
+def test_request_log_text(tmp_path):
+    text = log_requests(tmp_path / "log", "text", REQUESTS)
+    assert "secret" not in text
+    assert text.endswith(
+        "GET: https://vcenter/api/vcenter/vm\n"
+        "headers: {'vmware-api-session-id': '********', 'Accept': '*/*'}\n"
+        "  status: 200\n"
+        "  answer: []\n\n"
+    )
+
+
+def test_request_log_jsonl(tmp_path):
+    lines = log_requests(tmp_path / "log", "jsonl", REQUESTS).splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [r["answer"] for r in records] == ["********", "********", "[]"]
+    assert records[0]["headers"]["vmware-api-session-id"] == "********"
+    assert records[2]["status"] == 200
+
+
+def test_batch_result_has_the_perf_summary():
+    async def power(params, session):
+        # A module function, its result has the summary of the run so far
+        return await update_changed_flag({}, 204, "update")
+
+    async def bulk(collector):
+        if collector:
+            _perf_collector.set(collector)
+        return await run_vm_bulk_action({"vms": ["vm-1", "vm-2"]}, None, power)
+
+    result = run(bulk(PerfCollector()))
+    assert result["_perf"]["requests"] == 0
+    assert [r["vm"] for r in result["value"]] == ["vm-1", "vm-2"]
+    assert not [r for r in result["value"] if "_perf" in r]
+    assert "_perf" not in run(bulk(None))
+
+
+@pytest.mark.parametrize("ttl,requests", [(None, 2), ("60", 1)])
+def test_vm_document_cache(monkeypatch, ttl, requests):
+    if ttl:
+        monkeypatch.setenv("VMWARE_VM_DOCUMENT_TTL", ttl)
+    else:
+        monkeypatch.delenv("VMWARE_VM_DOCUMENT_TTL", raising=False)
+    session = FakeApi(lambda method, url, payload: (200, {"name": "vm1"}))
+    params = {"vcenter_hostname": "vcenter", "vm": "vm-1"}
+
+    async def module_run():
+        # Two reads in the same run
+        await get_vm_document(session, params)
+        return await get_vm_document(session, params)
+
+    for _ in range(2):
+        assert run(module_run()) == {"name": "vm1"}
+    assert len(session.requests) == requests
+
+
+def pooled_session():
+    session = VmwareRestSession(FakeApi(lambda method, url, payload: (204, None)), None)
+    session.session_id = "secret"
+    session.logout_url = "https://vcenter/api/session"
+    return session
+
+
+def test_session_pool_logs_out_the_evicted_sessions():
+    pool = SessionPool(max_size=1, max_idle=3600)
+    first, second = pooled_session(), pooled_session()
+
+    async def fill():
+        await pool.add("first", first)
+        await pool.add("second", second)
+
+    run(fill())
+    assert "first" not in pool and "second" in pool
+    assert first._session.requests == [("DELETE", "https://vcenter/api/session", None)]
+    assert first.closed and not second.closed
+
+
+def test_session_pool_keeps_the_sessions_in_use():
+    pool = SessionPool(max_size=1, max_idle=3600)
+    first, second = pooled_session(), pooled_session()
+
+    async def scenario():
+        done = asyncio.Event()
+
+        async def module_run():
+            first.lease()
+            await done.wait()
+
+        task = asyncio.ensure_future(module_run())
+        await asyncio.sleep(0)
+        await pool.add("first", first)
+        # Like open_session(), the new session is leased before being added
+        second.lease()
+        await pool.add("second", second)
+        assert len(pool) == 2 and first.users == 1
+        done.set()
+        await task
+        await asyncio.sleep(0)
+        await pool.evict()
+
+    run(scenario())
+    assert first.users == 0
+    assert "first" not in pool and first.closed
+
+
+DISK_URL = "https://vcenter/api/vcenter/vm/vm-1/hardware/disk"
+
+
+def find_disk(params, disks):
+    """Run exists() on the disks, return the match and the GET requests."""
+
+    def handler(method, url, payload):
+        if url == DISK_URL:
+            return 200, [{"disk": i} for i in disks]
+        return 200, disks[url.rpartition("/")[2]]
+
+    session = FakeApi(handler)
+    session.max_concurrency = 4
+    device = run(exists(params, session, DISK_URL, ["disk"]))
+    return device and device["id"], len(session.requests) - 1
+
+
+def test_exists_keeps_the_order_of_the_list():
+    disks = {f"200{i}": {"label": f"Hard disk {i}"} for i in range(4)}
+    disks["2001"]["pci_slot_number"] = 7
+    # The label is also the ID of a device, it is not checked first
+    disks["2003"]["label"] = "2003"
+    assert find_disk({"pci_slot_number": 7, "label": "2003"}, disks)[0] == "2001"
+
+
+@pytest.mark.parametrize(
+    "label,match,requests",
+    [
+        ("Hard disk 0", "2000", 1),
+        ("Hard disk 1", "2001", 3),
+        ("Hard disk 4", "2004", 7),
+        # The batches are capped by the session concurrency
+        ("Hard disk 8", "2008", 10),
+        ("Hard disk 10", None, 10),
+    ],
+)
+def test_exists_fetches_growing_batches(label, match, requests):
+    disks = {f"200{i}": {"label": f"Hard disk {i}"} for i in range(10)}
+    assert find_disk({"label": label}, disks) == (match, requests)
+
+
+def rest_session(handler, **kwargs):
+    """A VmwareRestSession over a FakeApi, its logins return id-1, id-2..."""
+    logins = []
+
+    async def login():
+        logins.append(f"id-{len(logins) + 1}")
+        return logins[-1]
+
+    session = VmwareRestSession(FakeApi(handler), login, **kwargs)
+    session.logins = logins
+    return session
+
+
+async def get_status(session, url="https://vcenter/api/vcenter/vm", **kwargs):
+    async with session.get(url, **kwargs) as resp:
+        await resp.read()
+        return resp.status
+
+
+def test_expired_session_is_renewed_once():
+    def handler(method, url, payload):
+        return (401, None) if session._session.session_ids[-1] == "id-1" else (200, [])
+
+    session = rest_session(handler)
+
+    async def scenario():
+        await session.authenticate()
+        # The concurrent requests that get a 401 share the same new login
+        return await asyncio.gather(*[get_status(session) for _ in range(5)])
+
+    assert run(scenario()) == [200] * 5
+    assert session.logins == ["id-1", "id-2"]
+    assert session._session.session_ids.count("id-2") == 5
+
+
+def test_revoked_credentials_are_not_retried_forever():
+    session = rest_session(lambda method, url, payload: (401, None))
+
+    async def scenario():
+        await session.authenticate()
+        return await get_status(session)
+
+    assert run(scenario()) == 401
+    assert session.logins == ["id-1", "id-2"]
+    assert len(session._session.requests) == 2
+
+
+@pytest.mark.parametrize("concurrency,env,expected", [(4, None, 4), (None, "5", 5)])
+def test_build_full_device_list_is_bounded(monkeypatch, concurrency, env, expected):
+    if env:
+        monkeypatch.setenv("VMWARE_MAX_CONCURRENT_REQUESTS", env)
+    ids = [str(2000 + i) for i in range(30)]
+    session = FakeSession()
+    devices = run(
+        build_full_device_list(
+            session, DISK_URL, [{"disk": i} for i in ids], concurrency=concurrency
+        )
+    )
+    assert devices == [{"value": {"name": i}, "id": i} for i in ids]
+    assert session.max_in_flight == expected
+
+
+def test_connector_settings(monkeypatch):
+    monkeypatch.setenv("VMWARE_CONNECTION_LIMIT", "50")
+    monkeypatch.setenv("VMWARE_KEEPALIVE_TIMEOUT", "")
+    monkeypatch.delenv("VMWARE_CONNECTION_LIMIT_PER_HOST", raising=False)
+    monkeypatch.delenv("VMWARE_DNS_CACHE_TTL", raising=False)
+    assert connector_settings(dns_cache_ttl="60") == {
+        "limit": 50,
+        "limit_per_host": 0,
+        "keepalive_timeout": 15.0,
+        "ttl_dns_cache": 60,
+    }
+    # The module arguments win over the environment
+    assert connector_settings(connection_limit=5)["limit"] == 5
+
+
+@pytest.mark.parametrize(
+    "limit,limit_per_host,expected", [(20, 0, 20), (20, 4, 4), (0, 8, 8), (0, 0, 0)]
+)
+def test_connection_limit(limit, limit_per_host, expected):
+    session = FakeSession()
+    session._connector = types.SimpleNamespace(
+        limit=limit, limit_per_host=limit_per_host
+    )
+    assert connection_limit(session) == expected
+
+
+@pytest.mark.parametrize(
+    "url,expected",
+    [
+        (
+            "https://vcenter/api/vcenter/vm/vm-1001/hardware/disk/2000?x=1",
+            "/api/vcenter/vm/{vm}/hardware/disk/{disk}",
+        ),
+        ("https://vcenter/api/vcenter/vm", "/api/vcenter/vm"),
+        ("https://vcenter/api/cis/tasks/52a1:abcd", "/api/cis/tasks/{tasks}"),
+    ],
+)
+def test_endpoint_template(url, expected):
+    assert endpoint_template(url) == expected
+
+
+def test_perf_summary_by_endpoint():
+    trace_config = perf_trace_config(aiohttp)
+
+    async def module_run():
+        collector = PerfCollector()
+        _perf_collector.set(collector)
+        for url, status, body in [
+            ("https://vcenter/api/vcenter/vm/vm-1", 200, b"{}"),
+            ("https://vcenter/api/vcenter/vm/vm-2", 503, b""),
+        ]:
+            ctx = types.SimpleNamespace()
+            params = types.SimpleNamespace(
+                method="GET",
+                url=url,
+                response=CachedResponse(status, {}, body),
+                chunk=body,
+            )
+            await trace_config.on_request_start[0](None, ctx, params)
+            await trace_config.on_request_end[0](None, ctx, params)
+            if body:
+                await trace_config.on_response_chunk_received[0](None, ctx, params)
+        return collector.summary()
+
+    summary = run(module_run())
+    assert summary["requests"] == 2
+    stats = summary["endpoints"]["GET /api/vcenter/vm/{vm}"]
+    assert (stats["count"], stats["errors"], stats["bytes"]) == (2, 1, 2)
+
+
+def retry_policy(**kwargs):
+    return RetryPolicy(aiohttp, **dict({"retries": 3, "backoff": 0.5}, **kwargs))
+
+
+@pytest.mark.parametrize(
+    "method,attempt,status,exception,expected",
+    [
+        ("GET", 0, 503, None, True),
+        ("get", 2, 429, None, True),
+        ("GET", 3, 503, None, False),
+        ("GET", 0, 500, None, False),
+        ("POST", 0, 503, None, False),
+        ("DELETE", 0, None, aiohttp.ServerDisconnectedError(), True),
+        ("GET", 0, None, ValueError(), False),
+        (
+            "GET",
+            0,
+            None,
+            aiohttp.ClientConnectorCertificateError(None, ValueError()),
+            False,
+        ),
+    ],
+)
+def test_should_retry(method, attempt, status, exception, expected):
+    policy = retry_policy()
+    assert policy.should_retry(method, attempt, status, exception) is expected
+
+
+def test_retry_methods_from_the_environment(monkeypatch):
+    monkeypatch.setenv("VMWARE_REST_RETRY_METHODS", "get, post")
+    assert retry_policy().should_retry("POST", 0, 503)
+    assert not retry_policy().should_retry("DELETE", 0, 503)
+
+
+@pytest.mark.parametrize(
+    "retry_after,expected",
+    [("2", 2.0), ("120", 30.0), ("-1", 0), ("Wed, 21 Oct 2015 07:28:00 GMT", 0)],
+)
+def test_retry_after(retry_after, expected):
+    resp = CachedResponse(503, {"Retry-After": retry_after}, b"")
+    assert retry_policy().delay(0, resp) == expected
+
+
+def test_backoff_is_exponential_with_a_full_jitter():
+    policy = retry_policy(max_backoff=3)
+    for attempt, ceiling in [(0, 0.5), (1, 1), (2, 2), (5, 3)]:
+        delays = [policy.delay(attempt) for _ in range(200)]
+        assert 0 <= min(delays) and max(delays) <= ceiling
+        assert max(delays) > ceiling / 2
+
+
+@pytest.mark.parametrize("method,requests", [("GET", 3), ("POST", 1)])
+def test_transient_failures_are_retried(method, requests):
+    statuses = [503, 503, 200]
+
+    def handler(method, url, payload):
+        return statuses.pop(0), None
+
+    session = rest_session(handler, retry_policy=retry_policy(backoff=0))
+
+    async def scenario():
+        await session.authenticate()
+        async with session.request(method, "https://vcenter/api/vcenter/vm") as resp:
+            return resp.status
+
+    assert run(scenario()) == (200 if requests == 3 else 503)
+    assert len(session._session.requests) == requests
+
+
+def test_limiter_halves_on_overload_and_grows_additively():
+    limiter = AdaptiveLimiter(max_limit=8, cooldown=0)
+
+    async def call(status):
+        await limiter.acquire()
+        await limiter.release(status, 0.1)
+
+    async def scenario():
+        for status in (503, 429, None):
+            await call(status)
+        assert limiter.limit == 1
+        await call(503)
+        # Never below the minimum
+        assert limiter.limit == 1
+        # One more slot per window of successful requests
+        for _ in range(3):
+            await call(200)
+        assert int(limiter.limit) == 2
+
+    run(scenario())
+
+
+def test_limiter_reacts_once_per_burst():
+    limiter = AdaptiveLimiter(max_limit=8, cooldown=60)
+
+    async def scenario():
+        for _ in range(4):
+            await limiter.acquire()
+        for _ in range(4):
+            await limiter.release(503, 0.1)
+
+    run(scenario())
+    assert limiter.limit == 4
+
+
+def test_limiter_caps_the_requests_in_flight():
+    limiter = AdaptiveLimiter(max_limit=2)
+
+    async def scenario():
+        await limiter.acquire()
+        await limiter.acquire()
+        third = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0.01)
+        assert not third.done()
+        await limiter.release(200, 0.1)
+        await asyncio.wait_for(third, 1)
+        assert limiter.in_flight == 2
+
+    run(scenario())
+
+
+def test_limiter_latency_signal():
+    limiter = AdaptiveLimiter(max_limit=8, cooldown=0, latency_signal=True)
+
+    async def scenario():
+        for latency in [0.1] * 10 + [1.0]:
+            await limiter.acquire()
+            await limiter.release(200, latency, "GET /api/vcenter/vm")
+        assert limiter.limit == 4
+        # The first call of another endpoint is not compared with this one
+        await limiter.acquire()
+        await limiter.release(200, 5.0, "POST /api/vcenter/vm")
+        assert limiter.limit == 4 + 1 / 4
+
+    run(scenario())
+
+
+def test_limiter_is_shared_by_vcenter(monkeypatch):
+    monkeypatch.setattr(AdaptiveLimiter, "_limiters", {})
+    assert AdaptiveLimiter.get("vcenter1") is AdaptiveLimiter.get("vcenter1")
+    assert AdaptiveLimiter.get("vcenter1") is not AdaptiveLimiter.get("vcenter2")
+    monkeypatch.setenv("VMWARE_REST_ADAPTIVE_LIMIT", "no")
+    assert AdaptiveLimiter.get("vcenter1") is None
+
+
+def test_session_token_cache(monkeypatch, tmp_path):
+    directory = tmp_path / "sessions"
+    monkeypatch.setenv("VMWARE_REST_SESSION_CACHE", str(directory))
+    cache = SessionTokenCache.from_env()
+    assert oct(directory.stat().st_mode & 0o777) == oct(0o700)
+    assert cache.read("digest") is None
+    cache.write("digest", "secret")
+    assert cache.read("digest") == "secret"
+    assert SessionTokenCache.from_env().read("digest") == "secret"
+    # Only the session file is left behind
+    assert sorted(os.listdir(directory)) == ["digest"]
+
+
+def test_session_token_cache_ignores_a_shared_directory(monkeypatch, tmp_path):
+    tmp_path.chmod(0o755)
+    monkeypatch.setenv("VMWARE_REST_SESSION_CACHE", str(tmp_path))
+    assert SessionTokenCache.from_env() is None
+    monkeypatch.delenv("VMWARE_REST_SESSION_CACHE")
+    assert SessionTokenCache.from_env() is None
+
+
+def test_session_token_cache_ignores_a_broken_file(tmp_path):
+    cache = SessionTokenCache(str(tmp_path))
+    (tmp_path / "digest").write_text("{")
+    assert cache.read("digest") is None
+
+
+def test_session_token_cache_lock(tmp_path):
+    cache = SessionTokenCache(str(tmp_path))
+    events = []
+
+    async def login(name):
+        # Two forks: the second one waits for the first one to log in
+        async with cache.lock("digest"):
+            events.append(f"{name} in")
+            await asyncio.sleep(0.05)
+            events.append(f"{name} out")
+
+    async def scenario():
+        await asyncio.gather(login("first"), login("second"))
+
+    run(scenario())
+    assert events in (
+        ["first in", "first out", "second in", "second out"],
+        ["second in", "second out", "first in", "first out"],
+    )
+
+
+def test_session_pool_evicts_the_least_recently_used():
+    pool = SessionPool(max_size=2, max_idle=3600)
+    sessions = {name: pooled_session() for name in ("a", "b", "c")}
+
+    async def scenario():
+        await pool.add("a", sessions["a"])
+        await pool.add("b", sessions["b"])
+        # a is used again, b becomes the least recently used
+        assert pool.get("a") is sessions["a"]
+        await pool.add("c", sessions["c"])
+
+    run(scenario())
+    assert ("a" in pool, "b" in pool, "c" in pool) == (True, False, True)
+    assert pool.stats() == {"sessions": 2, "sockets": 0}
+
+
+def test_session_pool_evicts_the_idle_and_closed_sessions():
+    pool = SessionPool(max_size=10, max_idle=60)
+    idle, active, closed = pooled_session(), pooled_session(), pooled_session()
+    idle.last_used = time.monotonic() - 120
+    active.last_used = time.monotonic()
+
+    async def scenario():
+        await pool.add("idle", idle)
+        await pool.add("active", active)
+        await pool.add("closed", closed)
+        await closed._session.close()
+        assert pool.get("closed") is None
+        await pool.evict()
+
+    run(scenario())
+    assert list(pool._sessions) == ["active"]
+    assert idle._session.requests == [("DELETE", "https://vcenter/api/session", None)]
+
+
+def test_exists_reuses_the_details_of_the_module_run():
+    disks = {f"200{i}": {"label": f"Hard disk {i}"} for i in range(3)}
+
+    def handler(method, url, payload):
+        if url == DISK_URL:
+            return 200, [{"disk": i} for i in disks]
+        return 200, disks[url.rpartition("/")[2]]
+
+    session = FakeApi(handler)
+
+    async def module_run():
+        first = await exists({"label": "Hard disk 2"}, session, DISK_URL)
+        second = await exists({"label": "Hard disk 1"}, session, DISK_URL)
+        return first["id"], second["id"]
+
+    assert run(module_run()) == ("2002", "2001")
+    # One list per check, the details are only fetched once
+    assert [url for _, url, _ in session.requests].count(DISK_URL) == 2
+    assert len(session.requests) == 5
+    # The next module run starts with an empty index
+    run(module_run())
+    assert len(session.requests) == 10
+
+
+VM_DOCUMENT = {
+    "name": "vm1",
+    "cpu": {"count": 2},
+    "disks": {
+        "2000": {"label": "Hard disk 1"},
+        "2001": {"label": "Hard disk 2"},
+    },
+}
+
+
+@pytest.mark.parametrize(
+    "params,key,id_key,expected",
+    [
+        ({}, None, None, {"value": VM_DOCUMENT, "id": "vm-1"}),
+        ({}, "cpu", None, {"value": {"count": 2}}),
+        ({}, "disks", "disk", {"value": [{"disk": "2000"}, {"disk": "2001"}]}),
+        (
+            {"disk": "2001"},
+            "disks",
+            "disk",
+            {"value": {"label": "Hard disk 2"}, "id": "2001"},
+        ),
+        (
+            {"label": "Hard disk 1"},
+            "disks",
+            "disk",
+            {"value": {"label": "Hard disk 1"}, "id": "2000"},
+        ),
+        ({"label": "Hard disk 3"}, "disks", "disk", {"value": {}}),
+        # Not in the document, the module falls back to the regular end-point
+        ({"disk": "2002"}, "disks", "disk", None),
+        ({}, "nics", "nic", None),
+        ({"vm": None}, None, None, None),
+    ],
+)
+def test_vm_document_info(params, key, id_key, expected):
+    session = FakeApi(lambda method, url, payload: (200, VM_DOCUMENT))
+    params = dict({"vcenter_hostname": "vcenter", "vm": "vm-1"}, **params)
+    assert run(vm_document_info(session, params, key, id_key)) == expected
+
+
+def test_vm_document_is_invalidated_by_a_write():
+    def handler(method, url, payload):
+        return (200, VM_DOCUMENT) if method == "GET" else (204, None)
+
+    session = rest_session(handler)
+    params = {"vcenter_hostname": "vcenter", "vm": "vm-1"}
+
+    async def module_run():
+        await session.authenticate()
+        await get_vm_document(session, params)
+        await get_vm_document(session, params)
+        url = "https://vcenter/api/vcenter/vm/vm-1/hardware/cpu"
+        async with session.patch(url, json={"count": 4}):
+            pass
+        await get_vm_document(session, params)
+
+    run(module_run())
+    assert [method for method, _, _ in session._session.requests] == [
+        "GET",
+        "PATCH",
+        "GET",
+    ]
+
+
+def test_response_cache():
+    session = rest_session(lambda method, url, payload: (200, {"url": url}))
+    session.responses = _DocumentCache(ttl=60, max_size=10)
+    vm = "https://vcenter/api/vcenter/vm/vm-1"
+
+    async def scenario():
+        await session.authenticate()
+        for url in (vm, vm, vm + "/hardware/disk", vm + "/hardware/disk"):
+            assert await get_status(session, url) == 200
+        async with session.get(vm) as resp:
+            assert await resp.json() == {"url": vm}
+        # Bypass the cache
+        await get_status(session, vm, cache=False)
+        # A write on a disk changes the VM and the disk list, not the others
+        await get_status(session, "https://vcenter/api/vcenter/host")
+        async with session.delete(vm + "/hardware/disk/2000"):
+            pass
+        for url in (vm, vm + "/hardware/disk", "https://vcenter/api/vcenter/host"):
+            await get_status(session, url)
+
+    run(scenario())
+    assert [
+        (method, urllib.parse.urlsplit(url).path)
+        for method, url, _ in session._session.requests
+    ] == [
+        ("GET", "/api/vcenter/vm/vm-1"),
+        ("GET", "/api/vcenter/vm/vm-1/hardware/disk"),
+        ("GET", "/api/vcenter/vm/vm-1"),
+        ("GET", "/api/vcenter/host"),
+        ("DELETE", "/api/vcenter/vm/vm-1/hardware/disk/2000"),
+        ("GET", "/api/vcenter/vm/vm-1"),
+        ("GET", "/api/vcenter/vm/vm-1/hardware/disk"),
+    ]
+
+
+def test_document_cache_ttl_and_size(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache = _DocumentCache(ttl=10, max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    # b was the least recently used
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+    now[0] += 11
+    assert cache.get("a") is None
+
+
+@pytest.mark.parametrize(
+    "value,payload,expected",
+    [
+        ({"count": 1, "hot_add": False}, {"count": 2}, {"count": 2, "hot_add": False}),
+        (
+            {"backing": {"type": "FILE", "file": "a.iso"}, "label": "CD/DVD 1"},
+            {"backing": {"file": "b.iso"}},
+            {"backing": {"type": "FILE", "file": "b.iso"}, "label": "CD/DVD 1"},
+        ),
+        # The payload wrapped in a spec key
+        ({"size_MiB": 1024}, {"spec": {"size_MiB": 2048}}, {"size_MiB": 2048}),
+        ({"spec": {"a": 1}}, {"spec": {"b": 2}}, {"spec": {"a": 1, "b": 2}}),
+        # The lists are replaced
+        ({"devices": [1, 2]}, {"devices": [3]}, {"devices": [3]}),
+        (None, {"count": 2}, {"count": 2}),
+    ],
+)
+def test_merge_update(value, payload, expected):
+    before = json.dumps(value)
+    assert merge_update(value, payload) == expected
+    assert json.dumps(value) == before
+
+
+def device_batch(devices, **params):
+    disks = {"2000": {"label": "Hard disk 1"}, "2001": {"label": "Hard disk 2"}}
+
+    def handler(method, url, payload):
+        if url == DISK_URL:
+            return 200, [{"disk": i} for i in disks]
+        return 200, disks[url.rpartition("/")[2]]
+
+    session = FakeApi(handler)
+    calls = []
+
+    def function(operation):
+        async def apply(item, session):
+            # The functions find the devices without listing them again
+            await exists(item, session, DISK_URL, ["disk"])
+            calls.append((operation, item["disk"], item.get("label")))
+            return {"value": {}, "changed": True, "failed": False}
+
+        return apply
+
+    params = dict(
+        {
+            "vcenter_hostname": "vcenter",
+            "vm": "vm-1",
+            "disk": None,
+            "label": None,
+            "state": None,
+            "capacity": None,
+            "devices": devices,
+        },
+        **params,
+    )
+    functions = {i: function(i) for i in ("create", "update", "delete")}
+    result = run(
+        run_device_batch(params, session, DISK_URL, "disk", functions, devices)
+    )
+    return result, sorted(calls), session.requests
+
+
+def test_device_batch():
+    result, calls, requests = device_batch(
+        [
+            {"label": "Hard disk 1", "capacity": 10},
+            {"capacity": 5},
+            {"disk": "2001", "state": "absent"},
+            {"label": "Hard disk 9", "state": "absent"},
+        ]
+    )
+    assert calls == [
+        ("create", None, None),
+        ("delete", "2001", None),
+        ("update", "2000", "Hard disk 1"),
+    ]
+    assert [r["changed"] for r in result["value"]] == [True, True, True, False]
+    assert result["changed"] and not result["failed"]
+    # One list and the details of the two disks
+    assert len(requests) == 3
+
+
+@pytest.mark.parametrize(
+    "devices,params,msg",
+    [
+        ([{"size": 1}], {}, "Unsupported device parameters: size"),
+        ([{"state": "connect"}], {}, "Unsupported state: connect"),
+        ([{"capacity": 1}], {"disk": "2000"}, "devices is mutually exclusive"),
+    ],
+)
+def test_device_batch_rejects_the_specs(devices, params, msg):
+    with pytest.raises(EmbeddedModuleFailure, match=msg):
+        device_batch(devices, **params)
+
+
+def task_api(progress):
+    """vCenter with tasks, ``progress`` maps their ID to their successive states."""
+
+    def handler(method, url, payload):
+        url = urllib.parse.urlsplit(url)
+        if url.path == "/api/cis/tasks":
+            ids = urllib.parse.parse_qs(url.query)["tasks"]
+            return 200, {i: progress[i].pop(0) for i in ids if i in progress}
+        if method == "POST":
+            return 200, "task-1"
+        return 200, {"name": "vm1"}
+
+    return FakeApi(handler)
+
+
+def test_task_poller_polls_all_the_tasks_at_once():
+    session = task_api(
+        {
+            "task-1": [{"status": "SUCCEEDED", "result": "vm-1"}],
+            "task-2": [{"status": "RUNNING"}] * 2 + [{"status": "FAILED"}],
+        }
+    )
+    poller = TaskPoller(session, "vcenter", min_interval=0.001, max_interval=0.01)
+
+    async def wait(task_id):
+        try:
+            return (await poller.wait(task_id))["status"]
+        except EmbeddedModuleFailure as e:
+            return e.get_message()
+
+    async def scenario():
+        return await asyncio.gather(*[wait(f"task-{i}") for i in (1, 2, 3)])
+
+    assert run(scenario()) == [
+        "SUCCEEDED",
+        "FAILED",
+        "The task task-3 is unknown to vCenter",
+    ]
+    assert len(session.requests) == 3
+    assert session.requests[0][1].endswith("?tasks=task-1&tasks=task-2&tasks=task-3")
+
+
+def test_task_poller_timeout():
+    session = task_api({"task-1": [{"status": "RUNNING"}] * 100})
+    poller = TaskPoller(session, "vcenter", min_interval=0.001, max_interval=0.001)
+    with pytest.raises(EmbeddedModuleFailure, match="not complete after 0.05"):
+        run(poller.wait("task-1", timeout=0.05))
+
+
+@pytest.mark.parametrize("wait_for_task", [True, False])
+def test_run_as_task(wait_for_task, monkeypatch):
+    monkeypatch.setenv("VMWARE_TASK_POLL_INTERVAL", "0.001")
+    session = task_api({"task-1": [{"status": "SUCCEEDED", "result": "vm-2"}]})
+    params = {"vcenter_hostname": "vcenter", "wait_for_task": wait_for_task}
+    result = run(
+        run_as_task(
+            params,
+            session,
+            "https://vcenter/api/vcenter/vm?action=clone",
+            {"name": "vm1"},
+            "clone",
+            fetch_url="https://vcenter/api/vcenter/vm",
+        )
+    )
+    assert session.requests[0][1].endswith("?action=clone&vmw-task=true")
+    if wait_for_task:
+        assert result["value"] == {"name": "vm1"}
+        assert (result["id"], result["task"], result["changed"]) == (
+            "vm-2",
+            "task-1",
+            True,
+        )
+    else:
+        assert result == {"value": {"task": "task-1"}, "changed": True, "failed": False}
+        assert len(session.requests) == 1
+
+
+@pytest.mark.parametrize(
+    "placement,expected",
+    [
+        (None, None),
+        ({"datastore": "datastore-1"}, None),
+        ({"folder": "group-v1"}, {"folders": ["group-v1"]}),
+        (
+            {"cluster": "domain-c1", "host": None, "resource_pool": "resgroup-1"},
+            {"clusters": ["domain-c1"], "resource_pools": ["resgroup-1"]},
+        ),
+    ],
+)
+def test_vm_scope(placement, expected):
+    assert vm_scope({"placement": placement}) == expected
+
+
+def vm_api(vms):
+    """vCenter with ``vms``, as (MoID, name, folder, host)."""
+
+    def handler(method, url, payload):
+        url = urllib.parse.urlsplit(url)
+        if url.path != "/api/vcenter/vm":
+            return 200, {"name": "vm1"}
+        query = urllib.parse.parse_qs(url.query)
+        return 200, [
+            {"vm": moid, "name": name}
+            for moid, name, folder, host in vms
+            if name in query["names"]
+            and folder in query.get("folders", [folder])
+            and host in query.get("hosts", [host])
+        ]
+
+    return FakeApi(handler)
+
+
+@pytest.mark.parametrize(
+    "placement,expected,queries",
+    [
+        # Not scoped, nothing is listed
+        ({}, None, []),
+        ({"folder": "group-v1"}, "vm-1", ["names=vm1&folders=group-v1"]),
+        # Moved to another host, found in its folder
+        (
+            {"folder": "group-v1", "host": "host-2"},
+            "vm-1",
+            ["names=vm1&folders=group-v1&hosts=host-2", "names=vm1&folders=group-v1"],
+        ),
+        # Ambiguous without a folder
+        ({"host": "host-1"}, None, ["names=vm1&hosts=host-1"]),
+    ],
+)
+def test_find_vm(placement, expected, queries):
+    session = vm_api(
+        [
+            ("vm-1", "vm1", "group-v1", "host-1"),
+            ("vm-2", "vm1", "group-v2", "host-1"),
+        ]
+    )
+    params = {"vcenter_hostname": "vcenter", "name": "vm1", "placement": placement}
+    result = run(find_vm(params, session))
+    assert (result and result["id"]) == expected
+    lists = [
+        urllib.parse.urlsplit(url).query
+        for _, url, _ in session.requests
+        if urllib.parse.urlsplit(url).path == "/api/vcenter/vm"
+    ]
+    assert lists == queries
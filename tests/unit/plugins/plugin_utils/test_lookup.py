@@ -0,0 +1,391 @@
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import asyncio
+import json
+import urllib
+
+import pytest
+from ansible_collections.vmware.vmware_rest.plugins.module_utils.vmware_rest import (
+    CachedResponse,
+)
+from ansible_collections.vmware.vmware_rest.plugins.plugin_utils import lookup
+from ansible_collections.vmware.vmware_rest.plugins.plugin_utils.lookup import (
+    InventorySnapshot,
+    InventoryStore,
+    Lookup,
+    MoidCache,
+    PathIndex,
+)
+
+# The parent of an object, for each list filter
+PARENT_FILTERS = {
+    "parent_folders": "parent",
+    "parent_resource_pools": "parent",
+    "folders": "folder",
+    "clusters": "cluster",
+    "hosts": "host",
+    "resource_pools": "resource_pool",
+    "datacenters": "datacenter",
+}
+
+
+class FakeGet:
+    def __init__(self, response):
+        self.response = response
+
+    async def __aenter__(self):
+        return self.response
+
+    async def __aexit__(self, *args):
+        pass
+
+
+class FakeVCenter:
+    """Answer the /api/vcenter list and get calls from an inventory."""
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.calls = []
+
+    def add(self, kind, moid, name, **kwargs):
+        self.objects[moid] = dict(kind=kind, name=name, **kwargs)
+
+    def get(self, url, **kwargs):
+        self.calls.append(url)
+        url = urllib.parse.urlparse(url)
+        path = url.path.split("/")[3:]
+        kind = path[0].replace("-", "_")
+        if len(path) == 2:
+            obj = self.objects.get(path[1])
+            body = {k: v for k, v in (obj or {}).items() if k != "kind"}
+            status = 200 if obj else 404
+        else:
+            query = urllib.parse.parse_qs(url.query)
+            body = [
+                dict({"name": o["name"], kind: moid}, **self.summary(o))
+                for moid, o in self.objects.items()
+                if o["kind"] == kind and self.match(moid, o, query)
+            ]
+            status = 200
+        return FakeGet(CachedResponse(status, {}, json.dumps(body).encode()))
+
+    @staticmethod
+    def summary(obj):
+        # The folder lists also return the type of the folders
+        return {"type": obj["type"]} if obj["kind"] == "folder" else {}
+
+    @staticmethod
+    def match(moid, obj, query):
+        for key, values in query.items():
+            if key == "names" and obj["name"] not in values:
+                return False
+            if key == "type" and obj.get("type") not in values:
+                return False
+            if key == f"{obj['kind']}s":
+                if moid not in values:
+                    return False
+            elif key in PARENT_FILTERS and obj.get(PARENT_FILTERS[key]) not in values:
+                return False
+        return True
+
+
+def inventory():
+    vcenter = FakeVCenter({})
+    # A folder called vm with a f1 child, deeper in the tree: /dc/vm/sub/vm/f1.
+    # They come first in the lists.
+    vcenter.add("folder", "group-v9", "vm", type="VIRTUAL_MACHINE", parent="group-v3")
+    vcenter.add("folder", "group-v10", "f1", type="VIRTUAL_MACHINE", parent="group-v9")
+    vcenter.add("vm", "vm-20", "vmA", folder="group-v10")
+    vcenter.add(
+        "resource_pool", "resgroup-3", "rp1", cluster="domain-c1", parent="resgroup-2"
+    )
+    vcenter.add("datacenter", "datacenter-1", "dc", folder="group-d1")
+    for moid, name, _type in [
+        ("group-v1", "vm", "VIRTUAL_MACHINE"),
+        ("group-h1", "host", "HOST"),
+        ("group-s1", "datastore", "DATASTORE"),
+        ("group-n1", "network", "NETWORK"),
+    ]:
+        vcenter.add("folder", moid, name, type=_type, parent="datacenter-1")
+    vcenter.objects["datacenter-1"].update(
+        vm_folder="group-v1",
+        host_folder="group-h1",
+        datastore_folder="group-s1",
+        network_folder="group-n1",
+    )
+    # /dc/vm/f1/vmA and /dc/vm/sub
+    vcenter.add("folder", "group-v2", "f1", type="VIRTUAL_MACHINE", parent="group-v1")
+    vcenter.add("folder", "group-v3", "sub", type="VIRTUAL_MACHINE", parent="group-v1")
+    vcenter.add("vm", "vm-10", "vmA", folder="group-v2")
+    # /dc/host/c1/Resources/rp1, and /dc/host/c1/Resources/rp1/rp1 above
+    vcenter.add(
+        "cluster", "domain-c1", "c1", folder="group-h1", resource_pool="resgroup-1"
+    )
+    vcenter.add("resource_pool", "resgroup-1", "Resources", cluster="domain-c1")
+    vcenter.add(
+        "resource_pool", "resgroup-2", "rp1", cluster="domain-c1", parent="resgroup-1"
+    )
+    for obj in vcenter.objects.values():
+        if obj["kind"] != "datacenter":
+            obj["datacenter"] = "datacenter-1"
+    # The root folder, and /f0/dc2/vm
+    vcenter.add("folder", "group-d1", "Datacenters", type="DATACENTER")
+    vcenter.add("folder", "group-d2", "f0", type="DATACENTER", parent="group-d1")
+    vcenter.add("datacenter", "datacenter-2", "dc2", folder="group-d2")
+    vcenter.add(
+        "folder",
+        "group-v20",
+        "vm",
+        type="VIRTUAL_MACHINE",
+        parent="datacenter-2",
+        datacenter="datacenter-2",
+    )
+    vcenter.objects["datacenter-2"]["vm_folder"] = "group-v20"
+    return vcenter
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    monkeypatch.setattr(MoidCache, "_cache", None)
+    monkeypatch.setattr(Lookup, "_roots", {})
+    monkeypatch.setattr(InventorySnapshot, "_snapshots", {})
+    monkeypatch.delenv("VMWARE_LOOKUP_CACHE_TTL", raising=False)
+
+
+def moid(vcenter, object_type, path, **options):
+    options.update(
+        {
+            "vcenter_hostname": "vcenter",
+            "vcenter_username": "user",
+            "object_type": object_type,
+            "session": vcenter,
+        }
+    )
+    return asyncio.run(Lookup(options).moid(path))
+
+
+@pytest.mark.parametrize(
+    "object_type,path,expected",
+    [
+        ("folder", "/dc/vm", "group-v1"),
+        ("folder", "/dc/vm/f1", "group-v2"),
+        ("folder", "/dc/vm/sub/vm", "group-v9"),
+        ("folder", "/dc/vm/sub/vm/f1", "group-v10"),
+        ("folder", "/dc/vm/sub/f1", ""),
+        ("vm", "/dc/vm/f1/vmA", "vm-10"),
+        ("vm", "/dc/vm/sub/vm/f1/vmA", "vm-20"),
+        ("resource_pool", "/dc/host/c1/Resources/rp1", "resgroup-2"),
+        ("resource_pool", "/dc/host/c1/Resources/rp1/rp1", "resgroup-3"),
+    ],
+)
+def test_nested_objects_with_the_same_name(object_type, path, expected):
+    assert moid(inventory(), object_type, path) == expected
+
+
+@pytest.mark.parametrize(
+    "object_type,path,expected",
+    [
+        ("datacenter", "/dc", "datacenter-1"),
+        ("datacenter", "/Datacenters/dc", "datacenter-1"),
+        ("datacenter", "/f0/dc2", "datacenter-2"),
+        ("datacenter", "/dc2", ""),
+        ("folder", "/f0/dc2/vm", "group-v20"),
+        ("folder", "/dc/vm/sub/vm/f1", "group-v10"),
+        ("resource_pool", "/dc/host/c1/rp1/rp1", "resgroup-3"),
+    ],
+)
+def test_snapshot(object_type, path, expected):
+    vcenter = inventory()
+    assert moid(vcenter, object_type, path, vcenter_inventory_snapshot=True) == expected
+
+
+def test_snapshot_resolves_the_datacenter():
+    vcenter = inventory()
+
+    async def lookups(username):
+        options = {
+            "vcenter_hostname": "vcenter",
+            "vcenter_username": username,
+            "object_type": "folder",
+            "session": vcenter,
+            "vcenter_inventory_snapshot": True,
+        }
+        return [
+            await Lookup(dict(options)).moid(path)
+            for path in ("/dc/vm/f1", "/f0/dc2/vm", "/dc/vm/sub")
+        ]
+
+    assert asyncio.run(lookups("user")) == ["group-v2", "group-v20", "group-v3"]
+    # Nothing is fetched out of the snapshots
+    assert not [url for url in vcenter.calls if "names=" in url]
+    calls = len(vcenter.calls)
+    assert asyncio.run(lookups("user")) == ["group-v2", "group-v20", "group-v3"]
+    assert len(vcenter.calls) == calls
+    # Each user has its own snapshots
+    asyncio.run(lookups("other"))
+    assert len(vcenter.calls) == 2 * calls
+
+
+def test_moid_cache(monkeypatch):
+    now = [0]
+    monkeypatch.setattr(lookup.time, "monotonic", lambda: now[0])
+    cache = MoidCache(ttl=10, max_size=2)
+    cache.set("a", "group-v1")
+    cache.set("b", "group-v2")
+    # Not found, not kept
+    cache.set("c", "")
+    assert cache.get("a") == "group-v1"
+    # b is the least recently used
+    cache.set("d", "group-v4")
+    assert (cache.get("a"), cache.get("b"), cache.get("d")) == (
+        "group-v1",
+        None,
+        "group-v4",
+    )
+    now[0] = 11
+    assert cache.get("a") is None
+    assert "a" not in cache._entries
+
+
+def test_moid_cache_disabled():
+    cache = MoidCache.get_cache()
+    assert cache.ttl == 0
+    cache.set("a", "group-v1")
+    assert cache.get("a") is None
+
+
+def test_lookups_reuse_the_prefixes(monkeypatch):
+    monkeypatch.setenv("VMWARE_LOOKUP_CACHE_TTL", "60")
+    vcenter = inventory()
+    vcenter.add("vm", "vm-11", "vmB", folder="group-v2", datacenter="datacenter-1")
+    assert moid(vcenter, "vm", "/dc/vm/f1/vmA") == "vm-10"
+    calls = len(vcenter.calls)
+    assert moid(vcenter, "vm", "/dc/vm/f1/vmB") == "vm-11"
+    # The datacenter and the folders are not fetched again
+    assert vcenter.calls[calls:] == [
+        "https://vcenter/api/vcenter/vm?datacenters=datacenter-1&folders=group-v2"
+        "&names=vmB"
+    ]
+    # Nor the path itself
+    calls = len(vcenter.calls)
+    assert moid(vcenter, "vm", "/dc/vm/f1/vmB") == "vm-11"
+    assert len(vcenter.calls) == calls
+
+
+def snapshot(vcenter, datacenter="datacenter-1"):
+    moid(vcenter, "folder", "/dc/vm", vcenter_inventory_snapshot=True)
+    key = ("vcenter", "user", datacenter)
+    return InventorySnapshot._snapshots[key].result()
+
+
+def test_path_index():
+    index = snapshot(inventory()).index
+    assert index.find(["vm", "f1"]) == [("group-v2", "folder")]
+    assert index.find(["vm", "f1"], "resource_pool") == []
+    assert index.find(["vm", "nope"]) == []
+    # The resource pools, with or without Resources
+    assert index.find(["host", "c1", "rp1"]) == [("resgroup-2", "resource_pool")]
+    assert index.find(["host", "c1", "Resources", "rp1", "rp1"]) == [
+        ("resgroup-3", "resource_pool")
+    ]
+    assert sorted(index.children(["vm"])) == [
+        ("f1", "group-v2", "folder"),
+        ("sub", "group-v3", "folder"),
+    ]
+    assert index.children(["vm", "sub", "vm"], "cluster") == []
+    # The index is serialized to JSON
+    copy = PathIndex.from_dict(json.loads(json.dumps(index.to_dict())))
+    assert copy.find(["vm", "sub", "vm", "f1"]) == [("group-v10", "folder")]
+    assert copy.to_dict() == index.to_dict()
+
+
+@pytest.mark.parametrize("data", [None, {"root": {}}, {"version": 2, "root": {}}])
+def test_path_index_format(data):
+    with pytest.raises(ValueError, match="Unsupported path index format"):
+        PathIndex.from_dict(data)
+
+
+def store_options(directory, username="user"):
+    return {
+        "vcenter_hostname": "vcenter",
+        "vcenter_username": username,
+        "vcenter_inventory_cache": str(directory),
+    }
+
+
+def test_inventory_store(tmp_path):
+    directory = tmp_path / "cache"
+    store = InventoryStore.from_options(store_options(directory))
+    assert directory.stat().st_mode & 0o777 == 0o700
+    assert store.read("datacenter-1") is None
+    original = snapshot(inventory())
+    store.write(original)
+    copy = store.read("datacenter-1")
+    assert copy.index.find(["vm", "f1"]) == [("group-v2", "folder")]
+    assert (copy.objects, copy.children) == (original.objects, original.children)
+    # Each user has its own file
+    other = InventoryStore.from_options(store_options(directory, "other"))
+    assert other.path != store.path
+    assert other.read("datacenter-1") is None
+
+
+def test_inventory_store_version(tmp_path):
+    store = InventoryStore.from_options(store_options(tmp_path / "cache"))
+    store.write(snapshot(inventory()))
+    with open(store.path, encoding="utf-8") as fd:
+        data = json.load(fd)
+    data["version"] = InventoryStore.VERSION + 1
+    with open(store.path, "w", encoding="utf-8") as fd:
+        json.dump(data, fd)
+    assert store.read("datacenter-1") is None
+
+
+def test_inventory_store_insecure_directory(tmp_path):
+    directory = tmp_path / "cache"
+    directory.mkdir(mode=0o755)
+    directory.chmod(0o755)
+    assert InventoryStore.from_options(store_options(directory)) is None
+    assert InventoryStore.from_options(store_options("")) is None
+
+
+def test_snapshot_from_the_store(tmp_path):
+    vcenter = inventory()
+    options = {"vcenter_inventory_snapshot": True}
+    options.update(store_options(tmp_path / "cache"))
+    assert moid(vcenter, "folder", "/dc/vm/f1", **options) == "group-v2"
+    # The next run reads the snapshots from the disk
+    InventorySnapshot._snapshots.clear()
+    vcenter.calls.clear()
+    assert moid(vcenter, "folder", "/dc/vm/sub", **options) == "group-v3"
+    assert vcenter.calls == []
+
+
+def test_snapshot_refresh(monkeypatch):
+    vcenter = inventory()
+    assert moid(vcenter, "folder", "/dc/vm/f2", vcenter_inventory_snapshot=True) == ""
+    build = len(vcenter.calls)
+    # Expired, the snapshot is refreshed by the next lookup
+    monkeypatch.setenv("VMWARE_INVENTORY_SNAPSHOT_TTL", "0")
+    vcenter.add(
+        "folder",
+        "group-v4",
+        "f2",
+        type="VIRTUAL_MACHINE",
+        parent="group-v1",
+        datacenter="datacenter-1",
+    )
+    vcenter.calls.clear()
+    assert (
+        moid(vcenter, "folder", "/dc/vm/f2", vcenter_inventory_snapshot=True)
+        == "group-v4"
+    )
+    # Only the content of the folders is listed again, a folder was added
+    assert "https://vcenter/api/vcenter/folder?parent_folders=group-v1" in vcenter.calls
+    assert not [
+        url
+        for url in vcenter.calls
+        if "clusters=" in url or "parent_resource_pools=" in url
+    ]
+    assert len(vcenter.calls) < build